@@ -0,0 +1,33 @@
+"""
+Daphne server with WebSocket compression for BuddyChat.
+
+Daphne does not negotiate permessage-deflate, this server accepts the offers of the clients that support it.
+Run it like daphne: ``python -m BuddyChat.server -b 0.0.0.0 -p 8000 BuddyChat.asgi:application``
+"""
+
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from daphne.cli import CommandLineInterface
+from daphne.server import Server
+from twisted.internet import reactor
+
+def accept_deflate(offers):
+    """Accepts the first permessage-deflate offer of a client, the frames of the other clients are not compressed"""
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            return PerMessageDeflateOfferAccept(offer)
+    return None
+
+class CompressingServer(Server):
+    def run(self):
+        # Server.run makes the WebSocket factory and then blocks in the reactor, so the factory is configured once the reactor runs
+        reactor.callWhenRunning(self.enable_compression)
+        super().run()
+
+    def enable_compression(self):
+        self.ws_factory.setProtocolOptions(perMessageCompressionAccept=accept_deflate)
+
+class CompressingCommandLineInterface(CommandLineInterface):
+    server_class = CompressingServer
+
+if __name__ == '__main__':
+    CompressingCommandLineInterface.entrypoint()
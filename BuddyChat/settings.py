@@ -144,7 +144,8 @@ GRAPHENE = {
     'SCHEMA': 'BuddyChatAPI.GraphQL.schema.schema',
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
-        'BuddyChatAPI.GraphQL.depth_middleware.depth_middleware',
+        'BuddyChatAPI.GraphQL.transaction_middleware.atomic_mutation_middleware',
+        'BuddyChatAPI.GraphQL.loaders.loader_middleware',
     ],
 }
 
@@ -160,11 +161,59 @@ GRAPHQL_JWT = {
     'JWT_EXPIRATION_DELTA': timedelta(minutes=50),
     'JWT_REFRESH_EXPIRATION_DELTA': timedelta(days=7),
     'JWT_LONG_RUNNING_REFRESH_TOKEN': True,
+    'JWT_GET_USER_BY_NATURAL_KEY_HANDLER': 'BuddyChatAPI.GraphQL.user_cache.get_user_by_natural_key',
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 ASGI_APPLICATION = 'BuddyChat.asgi.application'
+# Size of the thread pool that executes the GraphQL HTTP requests served over ASGI
+GRAPHQL_EXECUTOR_THREADS = 8
+# Operations that cost more are rejected, and each user can spend GRAPHQL_COST_BUDGET every GRAPHQL_COST_BUDGET_WINDOW seconds
+GRAPHQL_MAX_QUERY_COST = 10000
+GRAPHQL_COST_BUDGET = 100000
+GRAPHQL_COST_BUDGET_WINDOW = 60
+# Number of parsed and validated GraphQL documents kept in memory by each process
+GRAPHQL_DOCUMENT_CACHE_SIZE = 1000
+# Only run the queries registered with `manage.py register_persisted_queries`. Otherwise a valid query sent with its hash is registered,
+# in the database for authenticated users and in the bounded process cache for anonymous clients
+GRAPHQL_PERSISTED_QUERIES_ONLY = False
+
+# 'inline' fans out group messages in the request, 'queued' leaves it to `manage.py process_group_fan_out`
+GROUP_MESSAGE_FAN_OUT = 'inline'
+GROUP_MESSAGE_FAN_OUT_MAX_ATTEMPTS = 5
+# Groups with at least this many members store their messages once in a shared timeline
+GROUP_TIMELINE_THRESHOLD = 200
+# Each connection gets at most one NOTIFICATION_CREATED broadcast per notification every NOTIFICATION_BROADCAST_INTERVAL seconds,
+# the latest change held back is sent when the interval ends
+NOTIFICATION_BROADCAST_INTERVAL = 2
+# Seconds a chat list is cached, the message and chat events invalidate it earlier
+CHAT_LIST_CACHE_TIMEOUT = 300
+# Users are cached in process for USER_CACHE_LOCAL_TTL seconds, in front of the shared cache where they stay USER_CACHE_TIMEOUT seconds
+USER_CACHE_SIZE = 10000
+USER_CACHE_LOCAL_TTL = 5
+USER_CACHE_TIMEOUT = 300
+# Verified WebSocket tokens are remembered until they expire, up to this many
+WEBSOCKET_TOKEN_CACHE_SIZE = 10000
+# Broadcasts waiting to be sent to a subscription, a slower client is asked to resync
+SUBSCRIPTION_QUEUE_SIZE = 1000
+# Broadcasts are kept EVENT_LOG_RETENTION seconds for replay, `manage.py prune_event_log` deletes the older ones.
+# A client that missed more than EVENT_LOG_REPLAY_LIMIT events is asked to resync instead
+EVENT_LOG_RETENTION = 86400
+EVENT_LOG_REPLAY_LIMIT = 500
+# Tombstones of deleted rows are kept DELETION_RETENTION seconds, `manage.py prune_deletions` deletes the older ones.
+# changesSince asks for a resync when the cursor is older, or when more than SYNC_CHANGES_LIMIT rows of a kind changed
+DELETION_RETENTION = 2592000
+SYNC_CHANGES_LIMIT = 500
+# changesSince reads again the rows updated this many seconds before the cursor, written by transactions that had not committed yet
+SYNC_CURSOR_OVERLAP = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
 
 CHANNEL_LAYERS = {
     'default': {
@@ -16,13 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 from django_ratelimit.decorators import ratelimit
+from BuddyChatAPI.views import AsyncGraphQLView
 
-# @ratelimit(key='ip', rate='15/m', method='POST')
-def graphql_view(request):
-    return GraphQLView.as_view(graphiql=True)(request)
+graphql_view = AsyncGraphQLView.as_view(graphiql=True)
+# graphql_view = ratelimit(key='ip', rate='15/m', method='POST')(graphql_view)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('graphql', csrf_exempt(graphql_view)),
@@ -0,0 +1,73 @@
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from graphene_django.settings import graphene_settings
+from graphql_relay import cursor_to_offset
+from ..models import Chat
+from .subscriptions.signals import on_message_created, on_message_unsent, on_message_deleted, on_chat_deleted
+
+def chat_list_key(user_id):
+    return f'chat_list:ids:{user_id}'
+
+def load_chat_list(user_id):
+    """The ids of the chats of a user from the most recent last message to the oldest, with whether they are archived"""
+    chats = list(Chat.objects.filter(user_id=user_id).values_list('id', 'archived', 'last_message__date'))
+    # Chats without messages come last, the same order on every database
+    chats.sort(key=lambda chat: (chat[2] is not None, chat[2].timestamp() if chat[2] else 0, chat[0]), reverse=True)
+    return [{'id': chat_id, 'archived': archived} for chat_id, archived, _ in chats]
+
+def get_chat_list(user_id):
+    """Returns the cached chat list of a user, it is loaded on a miss"""
+    key = chat_list_key(user_id)
+    entries = cache.get(key)
+    if entries is None:
+        entries = load_chat_list(user_id)
+        cache.set(key, entries, timeout=getattr(settings, 'CHAT_LIST_CACHE_TIMEOUT', 300))
+    return entries
+
+def invalidate_chat_lists(*user_ids):
+    # A list loaded again before the commit would be cached without the change
+    transaction.on_commit(partial(cache.delete_many, [chat_list_key(user_id) for user_id in user_ids]))
+
+def get_chats(user_id, first=None, after=None, offset=None, archived=None, **kwargs):
+    """The chats of a user in the order of the cached chat list, up to the requested page and one more chat that tells whether there is a next page.
+    A page counted from the end, with last or before, needs every chat. The messages of the chats are not loaded"""
+    entries = get_chat_list(user_id)
+    if archived is not None:
+        entries = [entry for entry in entries if entry['archived'] == archived]
+    chat_ids = [entry['id'] for entry in entries]
+    after_offset = cursor_to_offset(after) if after else -1
+    if after_offset is not None and kwargs.get('last') is None and kwargs.get('before') is None:
+        end = after_offset + 1 + (offset or 0) + (first or graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        chat_ids = chat_ids[:end + 1]
+    if not chat_ids:
+        return Chat.objects.none()
+    position = Case(*[When(pk=chat_id, then=Value(index)) for index, chat_id in enumerate(chat_ids)], output_field=IntegerField())
+    return Chat.objects.filter(user_id=user_id, pk__in=chat_ids).select_related('user', 'other_user').order_by(position)
+
+# The chat list changes with the same events that are broadcast to the clients
+@receiver(on_message_created)
+@receiver(on_message_unsent)
+def invalidate_message_chat_list(instance, is_chat, **kwargs):
+    if is_chat:
+        invalidate_chat_lists(instance.chat.user_id)
+
+@receiver(on_message_deleted)
+def invalidate_deleted_message_chat_list(is_chat, chat_id, **kwargs):
+    if is_chat:
+        invalidate_chat_lists(*Chat.objects.filter(pk=chat_id).values_list('user_id', flat=True))
+
+@receiver(on_chat_deleted)
+def invalidate_deleted_chat_list(instance, is_chat, **kwargs):
+    if is_chat:
+        invalidate_chat_lists(instance.user_id)
+
+@receiver(post_save, sender=Chat)
+def invalidate_saved_chat_list(instance, created, update_fields=None, **kwargs):
+    # A message to oneself moves the chat without a message event
+    if created or (update_fields and not update_fields.isdisjoint({'archived', 'last_message'})):
+        invalidate_chat_lists(instance.user_id)
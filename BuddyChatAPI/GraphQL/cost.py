@@ -0,0 +1,94 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from graphene.relay import Connection
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError, get_named_type, is_composite_type
+from graphql.execution import ExecutionContext
+from graphql.execution.values import get_argument_values
+from graphql.language import FieldNode, FragmentSpreadNode
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.utils import get_http_authorization, get_payload
+
+def is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+def get_page_size(parent_type, field_name, arguments):
+    """The number of edges a connection field can return, the requested first/last capped by the field's max_limit"""
+    graphene_type = getattr(parent_type, 'graphene_type', None)
+    graphene_fields = getattr(getattr(graphene_type, '_meta', None), 'fields', None) or {}
+    graphene_field = graphene_fields.get(to_snake_case(field_name))
+    max_limit = getattr(graphene_field, 'max_limit', None) or graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    requested = arguments.get('first') or arguments.get('last')
+    return min(requested, max_limit) if requested else max_limit
+
+def get_cost(schema, selection_set, parent_type, fragments, variables, visited=frozenset()):
+    """The static cost of a selection set. Each object costs 1, and the cost of a connection's edges is multiplied by its page size"""
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            field = getattr(parent_type, 'fields', {}).get(name)
+            # Introspection fields are not charged
+            if field is None or name.startswith('__'):
+                continue
+            field_type = get_named_type(field.type)
+            children = get_cost(schema, selection.selection_set, field_type, fragments, variables, visited) if selection.selection_set else 0
+            if is_connection(field_type):
+                arguments = get_argument_values(field, selection, variables)
+                cost += 1 + get_page_size(parent_type, name, arguments) * children
+            elif is_composite_type(field_type):
+                cost += 1 + children
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            fragment = fragments.get(name)
+            if fragment is not None and name not in visited:
+                fragment_type = schema.get_type(fragment.type_condition.name.value) or parent_type
+                cost += get_cost(schema, fragment.selection_set, fragment_type, fragments, variables, visited | {name})
+        else:
+            fragment_type = schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+            cost += get_cost(schema, selection.selection_set, fragment_type, fragments, variables, visited)
+    return cost
+
+def get_cost_identity(request):
+    """The user that is charged for a request, the JWT username or the client address for anonymous requests"""
+    token = get_http_authorization(request)
+    if token:
+        try:
+            return f'user:{jwt_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(get_payload(token))}'
+        except JSONWebTokenError:
+            pass
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+def charge_cost_budget(request, cost):
+    """Charges the cost to the budget of the requesting user for the current window, and returns the remaining budget"""
+    budget = getattr(settings, 'GRAPHQL_COST_BUDGET', 100000)
+    window = getattr(settings, 'GRAPHQL_COST_BUDGET_WINDOW', 60)
+    key = f'graphql_cost:{get_cost_identity(request)}:{int(time.time() // window)}'
+    cache.add(key, 0, timeout=window)
+    try:
+        spent = cache.incr(key, cost)
+    except ValueError:
+        # The window expired between add and incr
+        cache.set(key, cost, timeout=window)
+        spent = cost
+    return budget - spent
+
+class CostExecutionContext(ExecutionContext):
+    """Computes the cost of an operation before it is executed. Operations over GRAPHQL_MAX_QUERY_COST are rejected,
+    and the cost is charged to a per-user budget of GRAPHQL_COST_BUDGET every GRAPHQL_COST_BUDGET_WINDOW seconds"""
+    def execute_operation(self, operation, root_value):
+        cost = get_cost(self.schema, operation.selection_set, self.schema.get_root_type(operation.operation), self.fragments, self.variable_values)
+        max_cost = getattr(settings, 'GRAPHQL_MAX_QUERY_COST', 10000)
+        request = self.context_value
+        request.graphql_cost = {'requested': cost, 'maximum': max_cost}
+        if cost > max_cost:
+            raise GraphQLError(f'Query is too expensive, its cost is {cost} and the maximum is {max_cost}', operation)
+        remaining = charge_cost_budget(request, cost)
+        request.graphql_cost['remaining'] = max(remaining, 0)
+        if remaining < 0:
+            raise GraphQLError('Query cost budget exceeded, try again later', operation)
+        return super().execute_operation(operation, root_value)
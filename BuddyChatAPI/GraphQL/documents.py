@@ -0,0 +1,46 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from graphql import GraphQLError, parse, specified_rules, validate
+
+class DocumentCache:
+    """LRU cache of parsed and validated documents, keyed by the hash of the query text and the validation rules"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.documents = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, schema, query, validation_rules=None, max_errors=None):
+        """Returns the parsed document of the query and its validation errors. Documents that do not parse are not cached"""
+        validation_rules = tuple(validation_rules or specified_rules)
+        key = (hashlib.sha256(query.encode()).hexdigest(), validation_rules)
+        with self.lock:
+            entry = self.documents.get(key)
+            if entry is not None:
+                self.documents.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            return None, [error]
+        entry = (document, validate(schema, document, validation_rules, max_errors))
+        with self.lock:
+            self.documents[key] = entry
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+        return entry
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.documents), 'max_size': self.max_size}
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.hits = self.misses = 0
+
+document_cache = DocumentCache(getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', 1000))
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import ModelSignal
+from ..models import GroupMember, GroupMessage, GroupMessageFanOut, Notification, UserGroup, UserGroupMemberCopy
+from .helpers import change_unread_count, upsert_notifications
+from .subscriptions.signals import on_message_created, on_notification_created
+
+def fan_out_group_message(message, user_group):
+    """Creates a group message for each group member that does not have the message yet, updates the group notification of these members,
+    and points the last message of each group copy to its own group message.
+    The number of queries is fixed, so it does not grow with the group size"""
+    if user_group.is_timeline:
+        return fan_out_timeline_message(message, user_group)
+    member_copies = list(
+        UserGroupMemberCopy.objects.filter(member__user_group_id=user_group.id)
+        .exclude(group_messages__message=message)
+        .select_related('member__member')
+    )
+    group_messages = GroupMessage.objects.bulk_create([GroupMessage(message=message, user_group_copy=member_copy, date=message.date, sender_id=message.sender_id) for member_copy in member_copies])
+    notifications = upsert_notifications(message, [member_copy.member.member_id for member_copy in member_copies], user_group=user_group)
+
+    # Each group copy points to its own group message, so the last messages are updated in a single statement
+    UserGroupMemberCopy.objects.filter(member__user_group_id=user_group.id).update(
+        last_message=Subquery(GroupMessage.objects.filter(message=message, user_group_copy=OuterRef('pk')).values('pk')[:1])
+    )
+    change_unread_count(UserGroupMemberCopy.objects.filter(member__user_group_id=user_group.id).exclude(member__member_id=message.sender_id), 1)
+
+    # Some backends (MySQL) do not return the primary keys of bulk inserted rows, so they are loaded back once
+    if not connection.features.can_return_rows_from_bulk_insert:
+        copy_ids = [member_copy.pk for member_copy in member_copies]
+        group_messages = GroupMessage.objects.filter(message=message, user_group_copy__in=copy_ids).select_related('message__sender', 'user_group_copy__member__member')
+
+    for group_message in group_messages:
+        ModelSignal.send(on_message_created, sender=GroupMessage, instance=group_message, is_chat=False)
+    send_notifications(notifications)
+    return group_messages
+
+def fan_out_timeline_message(message, user_group):
+    """Notifies the members of a timeline group about a message. The message itself is stored once in the group timeline,
+    and it is broadcast once to the whole group when it is created"""
+    group_members = GroupMember.objects.filter(user_group_id=user_group.id).exclude(member_id=message.sender_id)
+    change_unread_count(UserGroupMemberCopy.objects.filter(member__in=group_members), 1)
+    send_notifications(upsert_notifications(message, list(group_members.values_list('member_id', flat=True)), user_group=user_group))
+    return []
+
+def create_timeline_message(message, user_group):
+    """Stores a message once in the shared timeline of a group"""
+    group_message = GroupMessage.objects.create(message=message, user_group=user_group)
+    UserGroup.objects.filter(pk=user_group.pk).update(last_message=group_message)
+    user_group.last_message = group_message
+    return group_message
+
+def use_timeline(user_group):
+    """Switches a group to the shared timeline once it reaches GROUP_TIMELINE_THRESHOLD members. A group never switches back"""
+    threshold = getattr(settings, 'GROUP_TIMELINE_THRESHOLD', None)
+    if not user_group.is_timeline and threshold is not None and user_group.members_count >= threshold:
+        user_group.is_timeline = True
+        UserGroup.objects.filter(pk=user_group.pk).update(is_timeline=True)
+    return user_group.is_timeline
+
+def send_notifications(notifications):
+    for notification in notifications:
+        ModelSignal.send(on_notification_created, sender=Notification, instance=notification)
+
+def schedule_group_message_fan_out(message, user_group):
+    """Fans out a group message in the request, or queues it for the fan out worker when GROUP_MESSAGE_FAN_OUT is 'queued'"""
+    if getattr(settings, 'GROUP_MESSAGE_FAN_OUT', 'inline') == 'queued':
+        return GroupMessageFanOut.objects.create(message=message, user_group=user_group)
+    return fan_out_group_message(message, user_group)
+
+def process_fan_out_queue(limit=100):
+    """Processes up to limit queued fan outs, each one in its own transaction. Returns the number of processed entries.
+    Entries are locked with SKIP LOCKED so several workers can share the queue, and an entry is only removed
+    once its fan out is committed, so nothing is lost if a worker stops in the middle"""
+    max_attempts = getattr(settings, 'GROUP_MESSAGE_FAN_OUT_MAX_ATTEMPTS', 5)
+    processed = 0
+    while processed < limit:
+        with transaction.atomic():
+            fan_out = (
+                GroupMessageFanOut.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=max_attempts)
+                .select_related('message__sender', 'user_group')
+                .order_by('attempts', 'id')
+                .first()
+            )
+            if fan_out is None:
+                break
+            try:
+                with transaction.atomic():
+                    fan_out_group_message(fan_out.message, fan_out.user_group)
+            except Exception as error:
+                fan_out.attempts += 1
+                fan_out.last_error = str(error)
+                fan_out.save(update_fields=['attempts', 'last_error'])
+            else:
+                fan_out.delete()
+        processed += 1
+    return processed
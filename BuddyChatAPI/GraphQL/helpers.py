@@ -1,5 +1,7 @@
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.shortcuts import get_object_or_404
-from .types import CustomUser, GroupMember, Message, UserGroupMemberCopy
+from .types import ChatMessage, CustomUser, Deletion, GroupMember, Message, Notification, UserGroupMemberCopy
 from .validators import validate_message_content
 import bleach
 from graphene.relay.node import Node
@@ -28,3 +30,93 @@ def get_node_or_error(info, node_id):
     if not node:
         raise ValueError(f"Could not resolve to a node with the global id of '{node_id}'")
     return node
+
+def change_unread_count(queryset, delta):
+    """Adds delta to the unread counts of the chats or group copies of queryset in a single statement. Counts never go below zero"""
+    return queryset.update(unread_count=Greatest(F('unread_count') + delta, 0))
+
+def unread_chat_messages_count(*filters):
+    """Counts the unread messages of the other user in the outer chat, so the count is written by the same statement as the chat"""
+    unread = (
+        ChatMessage.objects.filter(*filters, chat=OuterRef('pk'), message__read_at__isnull=True)
+        .exclude(sender=OuterRef('user'))
+        .order_by()
+        .values('chat')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(unread), Value(0))
+
+def unread_group_messages_count(group_copy):
+    """Counts the unread messages of a group copy past its watermark, so the count is written by the same statement as the copy"""
+    unread = group_copy.unread_group_messages().order_by().annotate(group=Value(1)).values('group').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(unread), Value(0))
+
+def upsert_notifications(message, receiver_ids, chat=None, user_group=None):
+    """Points the live notification of each receiver for a chat or a group to the message, and counts the message.
+    Only the receivers without a notification for the conversation get a new row, so the queries do not depend on the number of receivers.
+    Returns the notifications of the receivers"""
+    conversation = {'chat': chat} if chat is not None else {'user_group': user_group}
+    notifications = Notification.objects.filter(receiver_id__in=receiver_ids, **conversation)
+    notify_message(notifications, message)
+    existing = set(notifications.values_list('receiver_id', flat=True))
+    new_receiver_ids = [receiver_id for receiver_id in receiver_ids if receiver_id not in existing]
+    if new_receiver_ids:
+        Notification.objects.bulk_create(
+            [Notification(message=message, receiver_id=receiver_id, date=message.date, sender_id=message.sender_id, **conversation) for receiver_id in new_receiver_ids],
+            ignore_conflicts=True,
+        )
+        # A notification inserted concurrently for the same conversation is kept, and counts the message like the existing ones
+        notify_message(notifications.filter(receiver_id__in=new_receiver_ids).exclude(message=message), message)
+    return notifications.select_related('message__sender', 'receiver')
+
+def notify_message(notifications, message):
+    """Points the notifications to the message and counts it"""
+    # count is set before is_read, MySQL assigns from left to right and would see the new is_read otherwise
+    notifications.update(
+        count=Case(When(is_read=True, then=Value(1)), default=F('count') + 1),
+        is_read=False,
+        message=message,
+        date=message.date,
+        sender_id=message.sender_id,
+    )
+
+def retract_notifications(message):
+    """Points the notifications of a message that is unsent back to the previous message of their conversation, and uncounts the message.
+    A notification that only announced the message, or has no previous message to point to, is deleted"""
+    deleted = []
+    for notification in message.notifications.all():
+        previous = None
+        if notification.is_read or notification.count > 1:
+            previous = previous_notified_message(notification, message)
+        if previous is None:
+            deleted.append((notification.id, notification.receiver_id))
+            continue
+        Notification.objects.filter(pk=notification.pk, message=message).update(
+            count=F('count') if notification.is_read else Greatest(F('count') - 1, 1),
+            message_id=previous.message_id,
+            date=previous.date,
+            sender_id=previous.sender_id,
+        )
+    record_deletions('NotificationType', deleted)
+    Notification.objects.filter(pk__in=[notification_id for notification_id, _ in deleted]).delete()
+
+def previous_notified_message(notification, message):
+    """The newest message copy of the notification's conversation before the message, that the receiver would be notified about"""
+    if notification.chat_id:
+        copies = ChatMessage.objects.filter(chat_id=notification.chat_id)
+    else:
+        group_copy = UserGroupMemberCopy.objects.filter(member__user_group_id=notification.user_group_id, member__member_id=notification.receiver_id).first()
+        if group_copy is None:
+            return None
+        copies = group_copy.visible_group_messages()
+    copies = copies.exclude(message=message)
+    # The receiver is not notified about their own messages, except in a self chat
+    if message.sender_id != notification.receiver_id:
+        copies = copies.exclude(sender_id=notification.receiver_id)
+    return copies.order_by('-date', '-message_id').first()
+
+def record_deletions(type_name, deleted, user_group_id=None):
+    """Stores a tombstone for each (object id, user id) pair of deleted rows, so changesSince reports the deletions.
+    The tombstones of user_group are reported to all of its members"""
+    Deletion.objects.bulk_create([Deletion(type_name=type_name, object_id=object_id, user_id=user_id, user_group_id=user_group_id) for object_id, user_id in deleted])
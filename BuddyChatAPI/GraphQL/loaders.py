@@ -0,0 +1,103 @@
+from django.db.models import Model, QuerySet
+from graphene.relay import Connection
+
+class ModelLoader:
+    """Loads the instances of a model by primary key, each instance is loaded once per request"""
+    def __init__(self, model):
+        self.model = model
+        self.cache = {}
+
+    def prime(self, instance):
+        self.cache.setdefault(instance.pk, instance)
+
+    def load_many(self, pks):
+        """Loads the missing primary keys in a single query and returns the loaded instances"""
+        missing = {pk for pk in pks if pk not in self.cache}
+        loaded = []
+        if missing:
+            loaded = list(self.model._default_manager.filter(pk__in=missing))
+            for instance in loaded:
+                self.prime(instance)
+        return loaded
+
+    def load(self, pk):
+        self.load_many([pk])
+        return self.cache.get(pk)
+
+class LoaderRegistry:
+    """The loaders of a request. It also remembers every instance resolved in the request,
+    so a relation is loaded for all the instances of a model at once instead of once per instance"""
+    def __init__(self):
+        self.loaders = {}
+        self.instances = {}
+        self.values = {}
+
+    def loader(self, model):
+        if model not in self.loaders:
+            self.loaders[model] = ModelLoader(model)
+        return self.loaders[model]
+
+    def prime(self, instances):
+        for instance in instances:
+            model = instance._meta.concrete_model
+            self.loader(model).prime(instance)
+            self.instances.setdefault(model, {})[id(instance)] = instance
+
+    def load(self, model, pk):
+        loader = self.loader(model)
+        if pk not in loader.cache:
+            self.prime(loader.load_many([pk]))
+        return loader.cache.get(pk)
+
+    def memoize(self, key, function):
+        """Computes a value once per request"""
+        if key not in self.values:
+            self.values[key] = function()
+        return self.values[key]
+
+    def load_related(self, instance, field_name):
+        """Resolves a foreign key of an instance, batched with the same foreign key of the other known instances of its model"""
+        field = instance._meta.get_field(field_name)
+        if field.is_cached(instance):
+            return getattr(instance, field_name)
+        pk = getattr(instance, field.attname)
+        if pk is None:
+            return None
+        loader = self.loader(field.related_model._meta.concrete_model)
+        if pk not in loader.cache:
+            siblings = self.instances.get(instance._meta.concrete_model, {}).values()
+            pks = {getattr(sibling, field.attname) for sibling in siblings} | {pk}
+            pks.discard(None)
+            self.prime(loader.load_many(pks))
+        related = loader.cache.get(pk)
+        field.set_cached_value(instance, related)
+        return related
+
+def get_loaders(info):
+    """Returns the loader registry of the request, it is created on first use"""
+    context = info.context
+    if isinstance(context, dict):
+        return context.setdefault('loaders', LoaderRegistry())
+    if not hasattr(context, 'loaders'):
+        context.loaders = LoaderRegistry()
+    return context.loaders
+
+def related_resolver(field_name):
+    """Resolver for a forward foreign key field that goes through the request loaders"""
+    def resolver(root, info, **kwargs):
+        return get_loaders(info).load_related(root, field_name)
+    return resolver
+
+class LoaderMiddleware:
+    """Registers the model instances returned by the resolvers, so the relations of a page are loaded together"""
+    def resolve(self, next, root, info, **kwargs):
+        result = next(root, info, **kwargs)
+        if isinstance(result, Model):
+            get_loaders(info).prime([result])
+        elif isinstance(result, Connection):
+            get_loaders(info).prime([edge.node for edge in result.edges if isinstance(edge.node, Model)])
+        elif isinstance(result, (QuerySet, list)):
+            get_loaders(info).prime([item for item in result if isinstance(item, Model)])
+        return result
+
+loader_middleware = LoaderMiddleware()
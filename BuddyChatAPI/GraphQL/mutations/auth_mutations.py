@@ -1,5 +1,5 @@
 import graphene
-from ...models import CustomUser, PhoneNumber
+from ...models import Chat, CustomUser, GroupMessage, Notification, PhoneNumber
 from ..types import CustomUserType, PhoneNumberType, PhoneNumberInputType
 from ..validators import validate_user_data, validate_phone_number
 from graphql_jwt.decorators import login_required
@@ -7,7 +7,7 @@ from django.utils import timezone
 import bleach
 from django.core.exceptions import PermissionDenied
 from graphql_jwt import ObtainJSONWebToken, Refresh, Verify, Revoke
-from ..helpers import get_node_or_error
+from ..helpers import get_node_or_error, record_deletions
 class CreateUser(graphene.Mutation):
     """Mutation to create a user. Deprecated"""
     class Arguments:
@@ -85,6 +85,16 @@ class DeleteUser(graphene.Mutation):
         if not user.check_password(password):
             raise PermissionDenied('Please, enter valid credentials')
         user_id = user.id
+        # The chats of the other users with this user are deleted with it, as are the copies of its group messages and the notifications of its messages
+        record_deletions('ChatType', Chat.objects.filter(other_user=user).exclude(user=user).values_list('id', 'user_id'))
+        sent_group_messages = GroupMessage.objects.filter(sender=user)
+        record_deletions('GroupMessageType', sent_group_messages.filter(user_group_copy__isnull=False).exclude(user_group_copy__member__member=user).values_list('id', 'user_group_copy__member__member_id'))
+        timeline_messages = {}
+        for group_message_id, user_group_id in sent_group_messages.filter(user_group__isnull=False).values_list('id', 'user_group_id'):
+            timeline_messages.setdefault(user_group_id, []).append((group_message_id, None))
+        for user_group_id, deleted in timeline_messages.items():
+            record_deletions('GroupMessageType', deleted, user_group_id=user_group_id)
+        record_deletions('NotificationType', Notification.objects.filter(sender=user).exclude(receiver=user).values_list('id', 'receiver_id'))
         user.delete()
         return DeleteUser(user_id=user_id)
     
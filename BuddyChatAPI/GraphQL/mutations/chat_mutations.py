@@ -1,13 +1,13 @@
 import graphene
 from graphql_jwt.decorators import login_required
-from ..validators import validate_chat_user, validate_update_chat_message, validate_delete_chat_message, validate_unsend_chat_message, validate_chat_member
-from ..helpers import create_message, get_node_or_error
-from ...models import Chat, ChatMessage, Notification, Message
+from ..validators import validate_chat_user, validate_update_chat_message, validate_delete_chat_message, validate_unsend_chat_message, validate_chat_member, validate_chat_message_in_chat, validate_read_chat_message
+from ..helpers import change_unread_count, create_message, get_node_or_error, record_deletions, retract_notifications, unread_chat_messages_count, upsert_notifications
+from ...models import Chat, ChatMessage, Notification, Message, read_up_to, sent_after
 from ..types import ChatType, ChatMessageType
 import bleach
 from django.utils import timezone
 
-from ..subscriptions.signals import on_message_created, on_message_deleted, on_message_updated, on_notification_created, on_chat_deleted, on_message_read, on_message_unsent
+from ..subscriptions.signals import on_message_created, on_message_deleted, on_message_updated, on_notification_created, on_chat_deleted, on_message_read, on_message_unsent, on_chat_read
 from django.db.models.signals import ModelSignal
 
 class CreateChat(graphene.Mutation):
@@ -58,21 +58,21 @@ class CreateChatMessage(graphene.Mutation):
         chat_message = ChatMessage.objects.create(chat=chat, message=message)
         chat_message.save()
         chat.last_message = chat_message
-        chat.save()
+        chat.save(update_fields=['last_message'])
         
         receiver = chat.other_user
-        notification = Notification.objects.create(receiver=receiver, message=message)
-        notification.save()
-        
         # If the chat is a self chat, return the chat message
         if receiver.id == sender_id:
+            upsert_notifications(message, [receiver.id], chat=chat)
             return CreateChatMessage(chat_message=chat_message)
         
         receiver_chat = Chat.objects.get(user=receiver, other_user=info.context.user)
+        notification = upsert_notifications(message, [receiver.id], chat=receiver_chat).get()
         receiver_chat_message = ChatMessage.objects.create(chat=receiver_chat, message=message)
         receiver_chat_message.save()
         receiver_chat.last_message = receiver_chat_message
-        receiver_chat.save()
+        receiver_chat.save(update_fields=['last_message'])
+        change_unread_count(Chat.objects.filter(pk=receiver_chat.pk), 1)
         ModelSignal.send(on_message_created, sender=ChatMessage, instance=chat_message, is_chat=True)
         ModelSignal.send(on_message_created, sender=ChatMessage, instance=receiver_chat_message, is_chat=True)
         ModelSignal.send(on_notification_created, sender=Notification, instance=notification)
@@ -89,8 +89,12 @@ class DeleteChat(graphene.Mutation):
     def mutate(self, info, chat_id):
         chat: Chat = get_node_or_error(info, chat_id)
         validate_chat_user(chat, info.context.user)
+        deleted = []
         for chat_message in chat.chat_messages.all():
+            deleted.append((chat_message.id, chat.user_id))
             chat_message.delete()
+        record_deletions('ChatMessageType', deleted)
+        Chat.objects.filter(pk=chat.pk).update(unread_count=0)
         ModelSignal.send(on_chat_deleted, sender=Chat, instance=chat, is_chat=True)
         return DeleteChat(success=True)
     
@@ -125,11 +129,59 @@ class SetChatMessageAsRead(graphene.Mutation):
     @login_required
     def mutate(self, info, chat_message_id):
         chat_message: ChatMessage = get_node_or_error(info, chat_message_id)
-        chat_message.message.read_at = timezone.now()
-        chat_message.message.save()
+        validate_read_chat_message(chat_message, info.context.user)
+        read_at = timezone.now()
+        # Only the first read of a message changes the unread count of the receiver's chat
+        if Message.objects.filter(pk=chat_message.message_id, read_at__isnull=True).update(read_at=read_at):
+            chat_message.message.read_at = read_at
+            # The message is in the receiver's chat, and one under the read watermark is already out of the count
+            receiver_chat = Chat.objects.filter(pk=chat_message.chat_id).exclude(read_up_to(chat_message.date, chat_message.message_id))
+            change_unread_count(receiver_chat, -1)
         ModelSignal.send(on_message_read, sender=Message, instance=chat_message, is_chat=True)
         return SetChatMessageAsRead(chat_message=chat_message)
 
+class MarkChatAsRead(graphene.Mutation):
+    """A mutation to mark every message of a chat as read up to a message, or up to the last message when no message is given"""
+    class Arguments:
+        chat_id = graphene.ID()
+        chat_message_id = graphene.ID()
+        
+    chat = graphene.Field(ChatType)
+    
+    @login_required
+    def mutate(self, info, chat_id, chat_message_id=None):
+        chat: Chat = get_node_or_error(info, chat_id)
+        validate_chat_user(chat, info.context.user)
+        if chat_message_id:
+            chat_message: ChatMessage = get_node_or_error(info, chat_message_id)
+            validate_chat_message_in_chat(chat_message, chat)
+        else:
+            chat_message = chat.last_message
+        if chat_message is None:
+            return MarkChatAsRead(chat=chat)
+        
+        date, message_id = chat_message.date, chat_message.message_id
+        # The watermark only moves forward, and the unread count is recomputed by the same statement
+        moved = Chat.objects.filter(pk=chat.pk).exclude(read_up_to(date, message_id)).update(
+            read_until=date,
+            read_until_message_id=message_id,
+            unread_count=unread_chat_messages_count(sent_after(date, message_id)),
+        )
+        if not moved:
+            return MarkChatAsRead(chat=chat)
+        chat.refresh_from_db(fields=['read_until', 'read_until_message_id', 'unread_count'])
+        
+        other_chat = None
+        if chat.other_user_id != chat.user_id:
+            other_chat = Chat.objects.select_related('user').filter(user_id=chat.other_user_id, other_user_id=chat.user_id).first()
+            if other_chat is not None:
+                Chat.objects.filter(pk=other_chat.pk).exclude(read_up_to(date, message_id, prefix='other_read_until')).update(
+                    other_read_until=date,
+                    other_read_until_message_id=message_id,
+                )
+        ModelSignal.send(on_chat_read, sender=Chat, instance=chat, is_chat=True, other_chat=other_chat)
+        return MarkChatAsRead(chat=chat)
+
 class UnsendChatMessage(graphene.Mutation):
     """A mutation to unsend a chat message. Unsend means to delete the message from the two chats"""
     class Arguments:
@@ -149,13 +201,18 @@ class UnsendChatMessage(graphene.Mutation):
         other_user_chat_message = ChatMessage.objects.get(chat=other_user_chat, message=message)
         other_user_chat_message_id = other_user_chat_message.id
         other_user_chat_last_message_id = other_user_chat.last_message.id
+        is_unread = other_user_chat.pk != chat.pk and not other_user_chat.has_read(other_user_chat_message)
+        retract_notifications(message)
+        record_deletions('ChatMessageType', {(chat_message_id, chat.user_id), (other_user_chat_message_id, other_user_chat.user_id)})
         message.delete()
+        if is_unread:
+            change_unread_count(Chat.objects.filter(pk=other_user_chat.pk), -1)
         
         # If the message being deleted is the last message in the chat, update the last_message field of the chat
         if last_message_id == chat_message_id:
-            last_message = chat.chat_messages.order_by('-message__date').first()
+            last_message = chat.chat_messages.order_by('-date').first()
             chat.last_message = last_message
-            chat.save()
+            chat.save(update_fields=['last_message'])
             
         # If the chat is a self chat then no need to update the last message of the other user's chat
         if chat.user.id == chat.other_user.id:
@@ -163,9 +220,9 @@ class UnsendChatMessage(graphene.Mutation):
         
         # If the message being deleted is the last message in the other user's chat, update the last_message field of the other user's chat
         if other_user_chat_last_message_id == other_user_chat_message_id:
-            last_message = other_user_chat.chat_messages.order_by('-message__date').first()
+            last_message = other_user_chat.chat_messages.order_by('-date').first()
             other_user_chat.last_message = last_message
-            other_user_chat.save()
+            other_user_chat.save(update_fields=['last_message'])
         
         ModelSignal.send(on_message_unsent, sender=ChatMessage, instance=chat_message, is_chat=True)
         ModelSignal.send(on_message_unsent, sender=ChatMessage, instance=other_user_chat_message, is_chat=True)
@@ -186,13 +243,17 @@ class DeleteChatMessage(graphene.Mutation):
         last_message_id = chat.last_message.id
         chat_message_id = chat_message.id
         chat_id = chat.id
+        is_unread = chat_message.sender_id != chat.user_id and not chat.has_read(chat_message)
+        record_deletions('ChatMessageType', [(chat_message_id, chat.user_id)])
         chat_message.delete()
+        if is_unread:
+            change_unread_count(Chat.objects.filter(pk=chat_id), -1)
         
         # If the message being deleted is the last message in the chat, update the last_message field of the chat
         if last_message_id == chat_message_id:
-            last_message = chat.chat_messages.order_by('-message__date').first()
+            last_message = chat.chat_messages.order_by('-date').first()
             chat.last_message = last_message
-            chat.save()
+            chat.save(update_fields=['last_message'])
         
         ModelSignal.send(on_message_deleted, sender=ChatMessage, message_id=chat_message_id, is_chat=True, chat_id=chat_id, username=info.context.user.username)
         return DeleteChatMessage(success=True)
@@ -210,7 +271,7 @@ class SetChatArchived(graphene.Mutation):
         chat = get_node_or_error(info, chat_id)
         validate_chat_user(chat, info.context.user)
         chat.archived = archived
-        chat.save()
+        chat.save(update_fields=['archived'])
         return SetChatArchived(chat=chat)
 
 class ChatMutations(graphene.ObjectType):
@@ -221,5 +282,6 @@ class ChatMutations(graphene.ObjectType):
     unsend_chat_message = UnsendChatMessage.Field()
     delete_chat_message = DeleteChatMessage.Field()
     set_chat_message_as_read = SetChatMessageAsRead.Field()
+    mark_chat_as_read = MarkChatAsRead.Field()
     set_chat_archived = SetChatArchived.Field()
     create_self_chat = CreateSelfChat.Field()
@@ -1,13 +1,14 @@
 import graphene
 import bleach
 from graphql_jwt.decorators import login_required
-from ..validators import validate_group_title, validate_group_message_sender, validate_admin, validate_message_content, validate_group_description, validate_group_creator, validate_group_copy_member, validate_group_member
-from ..helpers import create_group_member, create_message, get_node_or_error
-from ...models import UserGroup, GroupMember, GroupMessage, Notification, CustomUser, UserGroupMemberCopy
+from ..validators import validate_group_title, validate_group_message_sender, validate_admin, validate_message_content, validate_group_description, validate_group_creator, validate_group_copy_member, validate_group_member, validate_group_message_in_copy
+from ..helpers import change_unread_count, create_group_member, create_message, get_node_or_error, record_deletions, retract_notifications, unread_group_messages_count
+from ..fanout import schedule_group_message_fan_out, create_timeline_message, use_timeline
+from ...models import UserGroup, GroupMember, GroupMessage, GroupMessageFanOut, GroupMessageTombstone, CustomUser, UserGroupMemberCopy, read_up_to, watermark_covers
 from ..types import UserGroupType, GroupMemberType, GroupMessageType, UserGroupMemberCopyType, MessageType
 from django.utils import timezone
 from graphene.relay import Node
-from ..subscriptions.signals import on_message_created, on_message_updated, on_message_deleted, on_message_unsent, on_notification_created, on_chat_deleted, on_group_updated, on_group_removed, on_member_added, on_member_removed
+from ..subscriptions.signals import on_message_created, on_message_updated, on_message_deleted, on_message_unsent, on_chat_deleted, on_group_updated, on_group_removed, on_member_added, on_member_removed, on_chat_read
 from django.db.models.signals import ModelSignal
 
 class CreateGroup(graphene.Mutation):
@@ -25,12 +26,14 @@ class CreateGroup(graphene.Mutation):
         title = bleach.clean(title)
         user_group = UserGroup.objects.create(title=title, created_by=created_by)
         global_id = Node.to_global_id('CustomUserType', created_by_id)
-        create_group_member(user_group, global_id, info, is_admin=True)
+        group_member = create_group_member(user_group, global_id, info, is_admin=True)
         user_group.save()
+        ModelSignal.send(on_member_added, new_member=group_member, member_copy=group_member.group_copies.get(), sender=GroupMember)
         return CreateGroup(user_group=user_group)
     
 class CreateGroupMessage(graphene.Mutation):
-    """A mutation to create a group message. A group message is created for each group member, and a notification is created for each group member"""
+    """A mutation to create a group message. A group message is created for each group member, and a notification is created for each group member.
+    When GROUP_MESSAGE_FAN_OUT is 'queued', only the sender's group message is created here and the rest is left to the fan out worker"""
     class Arguments:
         group_copy_id = graphene.ID()
         content = graphene.String()
@@ -41,7 +44,7 @@ class CreateGroupMessage(graphene.Mutation):
     def mutate(self, info, group_copy_id, content):
         group_copy: UserGroupMemberCopy = get_node_or_error(info, group_copy_id)
         group_member = group_copy.member
-        user_group = group_copy.member.user_group
+        user_group = group_member.user_group
         sender_id = info.context.user.id
         
         # check if the sender is a member of the group
@@ -49,22 +52,14 @@ class CreateGroupMessage(graphene.Mutation):
         content = bleach.clean(content)
         validate_message_content(content)
         message = create_message(sender_id, content)
-        user_group_message = GroupMessage.objects.create(message=message, user_group_copy=group_copy)
-        user_group_message.save()
+        # Large groups keep a single shared timeline instead of a group message per member
+        if use_timeline(user_group):
+            user_group_message = create_timeline_message(message, user_group)
+        else:
+            user_group_message = GroupMessage.objects.create(message=message, user_group_copy=group_copy)
         ModelSignal.send(on_message_created, sender=GroupMessage, instance=user_group_message, is_chat=False)
         # Create group message for each group member - for deleting and unsending messages
-        for group_member in user_group.members.all():
-            if group_member.member.id == sender_id:
-                continue
-            group_member_copy = UserGroupMemberCopy.objects.get(member=group_member)
-            group_message = GroupMessage.objects.create(message=message, user_group_copy=group_member_copy)
-            group_message.save()
-            group_member_copy.last_message = group_message
-            group_member_copy.save()
-            notification = Notification.objects.create(receiver=group_member.member, message=message)
-            notification.save()
-            ModelSignal.send(on_message_created, sender=GroupMessage, instance=group_message, is_chat=False)
-            ModelSignal.send(on_notification_created, sender=Notification, instance=notification)
+        schedule_group_message_fan_out(message, user_group)
         return CreateGroupMessage(group_message=user_group_message)
     
 class CreateGroupMember(graphene.Mutation):
@@ -82,9 +77,7 @@ class CreateGroupMember(graphene.Mutation):
         admin_member = user_group.members.get(member=info.context.user)
         validate_admin(user_group, admin_member)
         group_member = create_group_member(user_group, member_id, info)
-        for member in user_group.members.all():
-            group_member_copy = UserGroupMemberCopy.objects.get(member=member)
-            ModelSignal.send(on_member_added, member_copy=group_member_copy, new_member=group_member, username=group_member_copy.member.member.username, sender=GroupMember)
+        ModelSignal.send(on_member_added, new_member=group_member, member_copy=group_member.group_copies.get(), sender=GroupMember)
         return CreateGroupMember(group_member=group_member)
 
 class ChangeAdmin(graphene.Mutation):
@@ -136,10 +129,7 @@ class UpdateGroup(graphene.Mutation):
         if title or description or group_image:
             user_group.updated_at = timezone.now()
             user_group.save()
-            
-            for member in user_group.members.all():
-                group_member_copy = UserGroupMemberCopy.objects.get(member=member)
-                ModelSignal.send(on_group_updated, sender=UserGroupMemberCopy, instance=group_member_copy)
+            ModelSignal.send(on_group_updated, sender=UserGroup, instance=user_group)
         return UpdateGroup(group_copy=user_group_copy)
 
 class DeleteGroup(graphene.Mutation):
@@ -153,8 +143,16 @@ class DeleteGroup(graphene.Mutation):
     def mutate(self, info, group_copy_id):
         user_group_copy = get_node_or_error(info, group_copy_id)
         validate_group_copy_member(user_group_copy, info.context.user)
+        deleted = []
         for group_message in user_group_copy.group_messages.all():
+            deleted.append((group_message.id, info.context.user.id))
             group_message.delete()
+        record_deletions('GroupMessageType', deleted)
+        # The shared timeline messages are hidden for this copy instead of being deleted
+        if user_group_copy.member.user_group.is_timeline:
+            user_group_copy.cleared_at = timezone.now()
+            user_group_copy.save(update_fields=['cleared_at'])
+        UserGroupMemberCopy.objects.filter(pk=user_group_copy.pk).update(unread_count=0)
         ModelSignal.send(on_chat_deleted, sender=UserGroupMemberCopy, instance=user_group_copy, is_chat=False)
         return DeleteGroup(success=True)
 
@@ -169,18 +167,23 @@ class UpdateGroupMessage(graphene.Mutation):
     @login_required
     def mutate(self, info, group_message_id, content):
         user_group_message: GroupMessage = get_node_or_error(info, group_message_id)
-        group_member = user_group_message.user_group_copy.member
-        validate_group_message_sender(group_member, user_group_message.message.sender.id)
+        user_group = user_group_message.get_user_group()
+        if user_group_message.user_group_copy:
+            group_member = user_group_message.user_group_copy.member
+        else:
+            group_member = user_group.members.filter(member=info.context.user).first()
+        validate_group_message_sender(group_member, user_group_message.message.sender_id)
         content = bleach.clean(content)
         validate_message_content(content)
         user_group_message.message.content = content
         user_group_message.message.save()
-        # Send signals to update the message for all group members
-        user_group = user_group_message.user_group_copy.member.user_group
-        for member in user_group.members.all():
-            group_member_copy = UserGroupMemberCopy.objects.get(member=member)
-            group_message = GroupMessage.objects.get(message=user_group_message.message, user_group_copy=group_member_copy)
-            ModelSignal.send(on_message_updated, sender=GroupMessage, instance=group_message, is_chat=False)
+        # A timeline message is shared by all group members, so it is broadcast once
+        if not user_group_message.user_group_copy:
+            ModelSignal.send(on_message_updated, sender=GroupMessage, instance=user_group_message, is_chat=False)
+            return UpdateGroupMessage(group_message=user_group_message)
+        # The update is broadcast once for the group members that have a copy, a queued fan out copies the updated message
+        group_message_ids = dict(GroupMessage.objects.filter(message=user_group_message.message, user_group_copy__isnull=False).values_list('user_group_copy_id', 'id'))
+        ModelSignal.send(on_message_updated, sender=GroupMessage, instance=user_group_message, is_chat=False, group_message_ids=group_message_ids)
         return UpdateGroupMessage(group_message=user_group_message)
 
 class DeleteGroupMessage(graphene.Mutation):
@@ -193,12 +196,28 @@ class DeleteGroupMessage(graphene.Mutation):
     @login_required
     def mutate(self, info, group_message_id):
         group_message = get_node_or_error(info, group_message_id)
+        # A timeline message is shared with the other members, so it is only hidden for the current user's copy
+        if group_message.user_group_id:
+            group_copy = UserGroupMemberCopy.objects.filter(member__user_group=group_message.user_group, member__member=info.context.user).first()
+            validate_group_copy_member(group_copy, info.context.user)
+            _, created = GroupMessageTombstone.objects.get_or_create(user_group_copy=group_copy, group_message=group_message)
+            if created and group_message.sender_id != info.context.user.id and not group_copy.has_read(group_message):
+                change_unread_count(UserGroupMemberCopy.objects.filter(pk=group_copy.pk), -1)
+            if created:
+                record_deletions('GroupMessageType', [(group_message.id, info.context.user.id)])
+            ModelSignal.send(on_message_deleted, sender=GroupMessage, message_id=group_message_id, is_chat=False, chat_id=group_copy.id, username=info.context.user.username)
+            return DeleteGroupMessage(success=True)
+        validate_group_copy_member(group_message.user_group_copy, info.context.user)
         last_message_id = group_message.user_group_copy.last_message.id
         chat_id = group_message.user_group_copy.id
+        is_unread = group_message.sender_id != group_message.user_group_copy.member.member_id and not group_message.user_group_copy.has_read(group_message)
+        record_deletions('GroupMessageType', [(group_message.id, group_message.user_group_copy.member.member_id)])
         group_message.delete()
+        if is_unread:
+            change_unread_count(UserGroupMemberCopy.objects.filter(pk=chat_id), -1)
         if last_message_id == group_message.id:
             group_message.user_group_copy.last_message = group_message.user_group_copy.group_messages.first()
-            group_message.user_group_copy.save()
+            group_message.user_group_copy.save(update_fields=['last_message'])
         ModelSignal.send(on_message_deleted, sender=GroupMessage, message_id=group_message_id, is_chat=False, chat_id=chat_id, username=info.context.user.username)
         return DeleteGroupMessage(success=True)
 
@@ -212,25 +231,91 @@ class UnsendGroupMessage(graphene.Mutation):
     @login_required
     def mutate(self, info, group_message_id):
         group_message = get_node_or_error(info, group_message_id)
+        if group_message.user_group_id:
+            return UnsendGroupMessage.unsend_timeline_message(info, group_message)
         group_member = group_message.user_group_copy.member
         validate_group_message_sender(group_member, group_message.message.sender.id)
-        last_message_id = group_message.user_group_copy.last_message.message.id
-        user_group = group_message.user_group_copy.member.user_group
-        group_messages = []
-        # Update last message for all group members
-        for member in user_group.members.all():
-            group_member_copy = UserGroupMemberCopy.objects.get(member=member)
-            if last_message_id == group_member_copy.last_message.message.id:
-                group_member_copy.last_message = group_member_copy.group_messages.first()
-                group_member_copy.save()
-            group_messages += group_member_copy.group_messages.filter(message=group_message.message)
+        # A fan out that is still queued would copy the message to the remaining members, only the existing copies are unsent
+        GroupMessageFanOut.objects.filter(message=group_message.message).delete()
+        group_messages = list(GroupMessage.objects.filter(message=group_message.message, user_group_copy__isnull=False).select_related('user_group_copy__member__member'))
+        deleted = [(copy_message.id, copy_message.user_group_copy.member.member_id) for copy_message in group_messages]
+        # The copies whose last message is unsent point to their previous message
+        for group_member_copy in UserGroupMemberCopy.objects.filter(last_message__in=group_messages):
+            group_member_copy.last_message = group_member_copy.group_messages.exclude(message=group_message.message).first()
+            group_member_copy.save(update_fields=['last_message'])
                 
+        if group_message.message.read_at is None:
+            change_unread_count(
+                UserGroupMemberCopy.objects.filter(group_messages__message=group_message.message)
+                .exclude(member__member_id=group_message.sender_id)
+                .exclude(read_up_to(group_message.date, group_message.message_id)), -1
+            )
+        retract_notifications(group_message.message)
+        record_deletions('GroupMessageType', deleted)
         group_message.message.delete()
         for group_message in group_messages:
             ModelSignal.send(on_message_unsent, sender=GroupMessage, instance=group_message, is_chat=False)
         
         return UnsendGroupMessage(success=True)
     
+    @staticmethod
+    def unsend_timeline_message(info, group_message):
+        """Unsends a message of the shared group timeline, which removes it for all group members at once"""
+        user_group = group_message.user_group
+        group_member = user_group.members.filter(member=info.context.user).first()
+        validate_group_message_sender(group_member, group_message.message.sender_id)
+        if group_message.message.read_at is None:
+            # The copies the message is visible to, as in UserGroupMemberCopy.visible_group_messages
+            change_unread_count(
+                UserGroupMemberCopy.objects.filter(member__user_group=user_group, member__joined_at__lte=group_message.date)
+                .exclude(member__member_id=group_message.sender_id)
+                .exclude(cleared_at__gte=group_message.date)
+                .exclude(tombstones__group_message=group_message)
+                .exclude(read_up_to(group_message.date, group_message.message_id)), -1
+            )
+        retract_notifications(group_message.message)
+        record_deletions('GroupMessageType', [(group_message.id, None)], user_group_id=user_group.id)
+        group_message.message.delete()
+        if user_group.last_message_id == group_message.id:
+            user_group.last_message = user_group.timeline_messages.first()
+            user_group.save()
+        ModelSignal.send(on_message_unsent, sender=GroupMessage, instance=group_message, is_chat=False)
+        return UnsendGroupMessage(success=True)
+    
+class MarkGroupAsRead(graphene.Mutation):
+    """A mutation to mark every message of a group copy as read up to a message, or up to the last visible message when no message is given"""
+    class Arguments:
+        group_copy_id = graphene.ID()
+        group_message_id = graphene.ID()
+        
+    group_copy = graphene.Field(UserGroupMemberCopyType)
+    
+    @login_required
+    def mutate(self, info, group_copy_id, group_message_id=None):
+        group_copy: UserGroupMemberCopy = get_node_or_error(info, group_copy_id)
+        validate_group_copy_member(group_copy, info.context.user)
+        if group_message_id:
+            group_message: GroupMessage = get_node_or_error(info, group_message_id)
+            validate_group_message_in_copy(group_message, group_copy)
+        else:
+            group_message = group_copy.visible_group_messages().order_by('-date', '-message_id').first()
+        if group_message is None or watermark_covers(group_copy.read_until, group_copy.read_until_message_id, group_message):
+            return MarkGroupAsRead(group_copy=group_copy)
+        
+        date, message_id = group_message.date, group_message.message_id
+        group_copy.read_until, group_copy.read_until_message_id = date, message_id
+        # The watermark only moves forward, and the unread count is recomputed by the same statement
+        moved = UserGroupMemberCopy.objects.filter(pk=group_copy.pk).exclude(read_up_to(date, message_id)).update(
+            read_until=date,
+            read_until_message_id=message_id,
+            unread_count=unread_group_messages_count(group_copy),
+        )
+        group_copy.refresh_from_db(fields=['read_until', 'read_until_message_id', 'unread_count'])
+        if not moved:
+            return MarkGroupAsRead(group_copy=group_copy)
+        ModelSignal.send(on_chat_read, sender=UserGroupMemberCopy, instance=group_copy, is_chat=False)
+        return MarkGroupAsRead(group_copy=group_copy)
+    
 class RemoveGroupMember(graphene.Mutation):
     """A mutation to remove a member from a group"""
     class Arguments:
@@ -247,12 +332,12 @@ class RemoveGroupMember(graphene.Mutation):
         validate_admin(user_group, admin_member)
         group_member: GroupMember = get_node_or_error(info, member_id)
         validate_group_member(user_group, group_member)
+        username = group_member.member.username
+        record_deletions('UserGroupMemberCopyType', group_member.group_copies.values_list('id', 'member__member_id'))
         group_member.delete()
         user_group.members_count -= 1
         user_group.save()
-        for member in user_group.members.all():
-            group_member_copy = UserGroupMemberCopy.objects.get(member=member)
-            ModelSignal.send(on_member_removed, member_copy=group_member_copy, member_id=member_id, username=group_member_copy.member.member.username, removed_by_id=info.context.user.id, sender=GroupMember)
+        ModelSignal.send(on_member_removed, user_group_id=user_group.id, member_id=member_id, username=username, removed_by_id=info.context.user.id, sender=GroupMember)
         return RemoveGroupMember(success=True)
 
 class LeaveGroup(graphene.Mutation):
@@ -269,12 +354,11 @@ class LeaveGroup(graphene.Mutation):
         node_id = Node.to_global_id('GroupMemberType', member_id)
         user_group = group_copy.member.user_group
         group_member = user_group.members.get(member=info.context.user)
+        record_deletions('UserGroupMemberCopyType', group_member.group_copies.values_list('id', 'member__member_id'))
         group_member.delete()
         user_group.members_count -= 1
         user_group.save()
-        for member in user_group.members.all():
-            group_member_copy = UserGroupMemberCopy.objects.get(member=member)
-            ModelSignal.send(on_member_removed, member_copy=group_member_copy, member_id=node_id, username=group_member_copy.member.member.username, left=True, sender=GroupMember)
+        ModelSignal.send(on_member_removed, user_group_id=user_group.id, member_id=node_id, username=info.context.user.username, left=True, sender=GroupMember)
         return LeaveGroup(success=True)
 
 class RemoveGroup(graphene.Mutation):
@@ -289,11 +373,12 @@ class RemoveGroup(graphene.Mutation):
         user_group_copy: UserGroupMemberCopy = get_node_or_error(info, group_copy_id)
         user_group = user_group_copy.member.user_group
         validate_group_creator(user_group, info.context.user)
-        group_id = Node.to_global_id('UserGroupType', user_group.id)
-        usernames = [member.member.username for member in user_group.members.all()]
+        user_group_id = user_group.id
+        group_id = Node.to_global_id('UserGroupType', user_group_id)
+        record_deletions('UserGroupMemberCopyType', UserGroupMemberCopy.objects.filter(member__user_group=user_group).values_list('id', 'member__member_id'))
+        record_deletions('NotificationType', user_group.notifications.values_list('id', 'receiver_id'))
         user_group.delete()
-        for username in usernames:
-            ModelSignal.send(on_group_removed, username=username, group_id=group_id, sender=UserGroup)
+        ModelSignal.send(on_group_removed, user_group_id=user_group_id, group_id=group_id, sender=UserGroup)
         return RemoveGroup(success=True)
 
 class SetArchiveGroup(graphene.Mutation):
@@ -309,7 +394,7 @@ class SetArchiveGroup(graphene.Mutation):
         user_group_copy = get_node_or_error(info, group_copy_id)
         validate_group_copy_member(user_group_copy, info.context.user)
         user_group_copy.is_archived = is_archived
-        user_group_copy.save()
+        user_group_copy.save(update_fields=['is_archived'])
         return SetArchiveGroup(group_copy=user_group_copy)
 
 class GroupMutations(graphene.ObjectType):
@@ -322,6 +407,7 @@ class GroupMutations(graphene.ObjectType):
     update_group_message = UpdateGroupMessage.Field()
     delete_group_message = DeleteGroupMessage.Field()
     unsend_group_message = UnsendGroupMessage.Field()
+    mark_group_as_read = MarkGroupAsRead.Field()
     remove_group_member = RemoveGroupMember.Field()
     leave_group = LeaveGroup.Field()
     remove_group_permanently = RemoveGroup.Field()
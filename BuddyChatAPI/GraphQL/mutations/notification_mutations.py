@@ -1,7 +1,11 @@
 import graphene
 from graphql_jwt.decorators import login_required
+from django.db.models.signals import ModelSignal
 from ..types import NotificationType
-from graphene.relay.node import Node
+from ..helpers import get_node_or_error
+from ..validators import validate_notification_receiver, validate_chat_user, validate_group_copy_member
+from ...models import Notification
+from ..subscriptions.signals import on_notifications_read
 
 class SetNotificationAsRead(graphene.Mutation):
     class Arguments:
@@ -11,6 +15,38 @@ class SetNotificationAsRead(graphene.Mutation):
     
     @login_required
     def mutate(self, info, notification_id):
-        notification = Node.get_node_from_global_id(info, notification_id)
+        notification: Notification = get_node_or_error(info, notification_id)
+        validate_notification_receiver(notification, info.context.user)
+        if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+            ModelSignal.send(on_notifications_read, sender=Notification, user=info.context.user, count=1, notification_id=notification_id)
         notification.is_read = True
         return SetNotificationAsRead(notification=notification)
+
+class SetNotificationsAsRead(graphene.Mutation):
+    """A mutation to set the unread notifications of the current user as read in a single update.
+    All of them are set as read, or only those of a chat, of a group, or up to a date"""
+    class Arguments:
+        chat_id = graphene.ID()
+        group_copy_id = graphene.ID()
+        until = graphene.DateTime()
+        
+    count = graphene.Int()
+    
+    @login_required
+    def mutate(self, info, chat_id=None, group_copy_id=None, until=None):
+        user = info.context.user
+        notifications = Notification.objects.filter(receiver=user, is_read=False)
+        if chat_id:
+            chat = get_node_or_error(info, chat_id)
+            validate_chat_user(chat, user)
+            notifications = notifications.filter(chat=chat)
+        if group_copy_id:
+            group_copy = get_node_or_error(info, group_copy_id)
+            validate_group_copy_member(group_copy, user)
+            notifications = notifications.filter(user_group_id=group_copy.member.user_group_id)
+        if until:
+            notifications = notifications.filter(date__lte=until)
+        count = notifications.update(is_read=True)
+        if count:
+            ModelSignal.send(on_notifications_read, sender=Notification, user=user, count=count, chat_id=chat_id, group_copy_id=group_copy_id, until=until)
+        return SetNotificationsAsRead(count=count)
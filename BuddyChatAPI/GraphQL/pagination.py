@@ -0,0 +1,48 @@
+from datetime import datetime
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+
+def encode_cursor(date, id):
+    return base64(f'{date.isoformat()}|{id}')
+
+def decode_cursor(cursor):
+    try:
+        date, id = unbase64(cursor).split('|')
+        return datetime.fromisoformat(date), int(id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+
+def keyset_connection(connection_type, queryset, first=None, after=None, date_field='date', id_field='message_id'):
+    """Resolves a page of a connection ordered from the newest to the oldest by (date, id).
+    The page seeks past the after cursor instead of skipping the previous rows, so every page costs the same"""
+    if first is not None and first <= 0:
+        raise GraphQLError('first must be a positive number')
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    first = min(first or max_limit, max_limit)
+    if after:
+        date, id = decode_cursor(after)
+        queryset = queryset.filter(Q(**{f'{date_field}__lt': date}) | Q(**{date_field: date, f'{id_field}__lt': id}))
+    if '__' in date_field:
+        queryset = queryset.select_related(date_field.rsplit('__', 1)[0])
+    # One extra row tells whether there is a next page
+    rows = list(queryset.order_by(f'-{date_field}', f'-{id_field}')[:first + 1])
+    nodes = rows[:first]
+    date_attr, id_attr = date_field.split('__'), id_field.split('__')
+    edges = [connection_type.Edge(node=node, cursor=encode_cursor(get_path(node, date_attr), get_path(node, id_attr))) for node in nodes]
+    return connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            has_next_page=len(rows) > first,
+            has_previous_page=bool(after),
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+        )
+    )
+
+def get_path(instance, path):
+    for attr in path:
+        instance = getattr(instance, attr)
+    return instance
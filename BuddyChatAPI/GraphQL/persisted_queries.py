@@ -0,0 +1,70 @@
+import hashlib
+from django.conf import settings
+from django.db import IntegrityError
+from graphql import GraphQLError
+from ..models import PersistedQuery
+
+# Query texts of the recently used hashes, so a persisted query is read from the database once per process
+_queries = {}
+_QUERIES_CACHE_SIZE = 1000
+
+def get_query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+def load_persisted_query(sha256_hash):
+    query = _queries.get(sha256_hash)
+    if query is None:
+        query = PersistedQuery.objects.filter(sha256_hash=sha256_hash).values_list('query', flat=True).first()
+        if query is not None:
+            cache_persisted_query(sha256_hash, query)
+    return query
+
+def cache_persisted_query(sha256_hash, query):
+    if len(_queries) >= _QUERIES_CACHE_SIZE:
+        _queries.clear()
+    _queries[sha256_hash] = query
+
+def register_persisted_query(query):
+    """Stores a query under its hash, and returns the hash"""
+    sha256_hash = get_query_hash(query)
+    if load_persisted_query(sha256_hash) is None:
+        try:
+            PersistedQuery.objects.get_or_create(sha256_hash=sha256_hash, defaults={'query': query})
+        except IntegrityError:
+            # Registered concurrently by another request
+            pass
+        cache_persisted_query(sha256_hash, query)
+    return sha256_hash
+
+def resolve_persisted_query(query, extensions):
+    """Returns the query text of a request that may send the hash of a persisted query in extensions.persistedQuery.
+    With GRAPHQL_PERSISTED_QUERIES_ONLY set, only the registered queries are allowed"""
+    persisted_only = getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_ONLY', False)
+    persisted_query = (extensions or {}).get('persistedQuery')
+    if not persisted_query:
+        if persisted_only and query and load_persisted_query(get_query_hash(query)) is None:
+            raise GraphQLError('Only persisted queries are allowed', extensions={'code': 'PERSISTED_QUERY_NOT_ALLOWED'})
+        return query
+
+    sha256_hash = persisted_query.get('sha256Hash')
+    if not query:
+        query = load_persisted_query(sha256_hash)
+        if query is None:
+            raise GraphQLError('PersistedQueryNotFound', extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+        return query
+
+    if get_query_hash(query) != sha256_hash:
+        raise GraphQLError('The persisted query hash does not match the query', extensions={'code': 'INVALID_PERSISTED_QUERY_HASH'})
+    if persisted_only and load_persisted_query(sha256_hash) is None:
+        raise GraphQLError('Only persisted queries are allowed', extensions={'code': 'PERSISTED_QUERY_NOT_ALLOWED'})
+    return query
+
+def remember_persisted_query(query, extensions, user):
+    """Registers the query of a request that sent it with its hash, once its document was parsed and validated.
+    Only the queries of authenticated users are stored in the database, those of anonymous clients are kept in the bounded in-process cache"""
+    if getattr(settings, 'GRAPHQL_PERSISTED_QUERIES_ONLY', False) or not (extensions or {}).get('persistedQuery'):
+        return
+    if user is not None and user.is_authenticated:
+        register_persisted_query(query)
+    elif load_persisted_query(get_query_hash(query)) is None:
+        cache_persisted_query(get_query_hash(query), query)
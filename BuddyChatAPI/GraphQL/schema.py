@@ -1,11 +1,14 @@
 import graphene
 from graphene.relay.node import Node
 from graphene_django.filter import DjangoFilterConnectionField
-from .types import CustomUserType, ChatType, NotificationType, UserGroupMemberCopyType, SubsctiptionType
-from .mutations.notification_mutations import SetNotificationAsRead
+from .types import CustomUserType, ChatType, ChangesType, NotificationType, UserGroupMemberCopyType, SubsctiptionType
+from .mutations.notification_mutations import SetNotificationAsRead, SetNotificationsAsRead
 from .mutations.auth_mutations import AuthMutation
 from .mutations.group_mutations import GroupMutations
 from .mutations.chat_mutations import ChatMutations
+from .chat_list import get_chats
+from .sync import get_changes
+from .subscriptions.filters import EventFilter
 from graphql_jwt.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from ..models import CustomUser, GroupMember, Chat, UserGroupMemberCopy, ChatMessage, Message
@@ -23,11 +26,12 @@ class Query(graphene.ObjectType):
     chat = graphene.Field(ChatType, id=graphene.ID(), description="Resolve a chat for the current user")
     group = graphene.Field(UserGroupMemberCopyType, id=graphene.ID(), description="Resolve a group copy for the current user")
     user = graphene.Field(CustomUserType, id=graphene.ID(), description="Resolve a user")
+    changes_since = graphene.Field(ChangesType, cursor=graphene.String(), description="The chats, groups, messages and notifications of the current user that changed or were deleted since the cursor, and the next cursor")
         
     @login_required
     def resolve_chats(self, info, **kwargs):
         """Resolves the chats for the current user"""
-        return Chat.objects.filter(user=info.context.user).select_related('user', 'other_user').prefetch_related('chat_messages__message__sender__phone_numbers')
+        return get_chats(info.context.user.id, **kwargs)
     
     @login_required
     def resolve_groups(self, info, **kwargs):
@@ -52,6 +56,11 @@ class Query(graphene.ObjectType):
             return user_group
         raise PermissionDenied("You are not allowed to view this group")
     
+    @login_required
+    def resolve_changes_since(self, info, cursor=None):
+        """Resolves the changes of the current user since the cursor"""
+        return get_changes(info.context.user, cursor)
+    
     def resolve_user(self, info, id):
         """Resolves a user"""
         user: CustomUser = Node.get_node_from_global_id(info, id)
@@ -60,13 +69,22 @@ class Query(graphene.ObjectType):
 class Mutation(AuthMutation, GroupMutations, ChatMutations, graphene.ObjectType):
     """The Root Mutation for the GraphQL API"""
     set_notification_read = SetNotificationAsRead.Field(description="Set a notification as read")
+    set_notifications_read = SetNotificationsAsRead.Field(description="Set the notifications of the current user as read, all of them or those of a chat, a group or up to a date")
     
 class Subscription(graphene.ObjectType):
     """The Root Subscription for the GraphQL API"""
-    subscribe = graphene.Field(SubsctiptionType, description="The subscription for the API")
+    subscribe = graphene.Field(
+        SubsctiptionType,
+        operations=graphene.List(graphene.String, description="Only the broadcasts of these operations, e.g. CHAT_MESSAGE_CREATED"),
+        chat_ids=graphene.List(graphene.ID, description="Only the broadcasts about these chats, and the group copies of groupCopyIds"),
+        group_copy_ids=graphene.List(graphene.ID, description="Only the broadcasts about these group copies, and the chats of chatIds"),
+        description="The subscription for the API"
+    )
     
-    async def subscribe_subscribe(root, info):
+    async def subscribe_subscribe(root, info, operations=None, chat_ids=None, group_copy_ids=None):
         """Subscribes to the subscription"""
+        if isinstance(info.context, dict):
+            info.context['event_filter'] = EventFilter(operations, chat_ids, group_copy_ids)
         yield {
             'success': True
         }
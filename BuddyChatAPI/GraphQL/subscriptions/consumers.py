@@ -1,15 +1,76 @@
+import asyncio
 import json
+import logging
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from graphene.relay import Node
+from graphql import ExecutionResult, GraphQLError, subscribe
+from ..documents import document_cache
+from ..persisted_queries import remember_persisted_query, resolve_persisted_query
 from ..schema import schema
+from ...models import UserGroupMemberCopy
+from .encoding import get_encoder
+from .event_log import get_missed_events
+from .signals import group_channel_name
+
+logger = logging.getLogger(__name__)
+
+# Sent instead of the broadcasts a client can no longer receive, it reads the changes again with changesSince
+RESYNC_REQUIRED = {'type': 'broadcast', 'operation': 'RESYNC_REQUIRED'}
+
+class Subscription:
+    """A subscription of a connection. Its task sends the broadcasts of its queue, those its event filter matches.
+    The queue holds at most SUBSCRIPTION_QUEUE_SIZE broadcasts, a subscription that falls further behind drops them and is asked to resync"""
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=getattr(settings, 'SUBSCRIPTION_QUEUE_SIZE', 1000))
+        self.event_filter = None
+        self.task = None
+        # The sequence number of the last event replayed, so a replayed event is not sent again live.
+        # The batches are logged in the order of their numbers, so every event up to it was in the replay
+        self.last_seq = None
+
+    def matches(self, event):
+        if self.last_seq is not None and event.get('seq') is not None and event['seq'] <= self.last_seq:
+            return False
+        return self.event_filter is None or self.event_filter.matches(event)
+
+    def put(self, event):
+        # Events that arrive before the operation declared its filter are checked again when they are sent
+        if not self.matches(event):
+            return
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC_REQUIRED
+        self.queue.put_nowait(event)
+
+def get_resume_from(extensions):
+    """The sequence number of extensions.resumeFrom, or None"""
+    resume_from = (extensions or {}).get('resumeFrom')
+    if resume_from is None:
+        return None
+    try:
+        return int(resume_from)
+    except (TypeError, ValueError):
+        raise GraphQLError('resumeFrom must be a sequence number')
 
 class MainConsumer(AsyncWebsocketConsumer):
+    """A graphql-transport-ws connection. Each subscription of the connection runs in its own task,
+    and receives the broadcasts of the user through its own queue. The messages are JSON text frames,
+    or compact MessagePack frames when the client picked the graphql-transport-ws.msgpack subprotocol"""
     async def connect(self):
+        self.subscriptions = {}
+        # The NOTIFICATION_CREATED broadcasts held back by the throttle, by notification id, until the interval ends
+        self.notifications_sent_at = None
+        self.held_notifications = {}
+        self.notifications_timer = None
         self.user = self.scope.get('user')
         if not self.user:
             await self.close()
         else:
             self.user = await self.user
-            if not self.user.is_authenticated:
+            if not self.user or not self.user.is_authenticated:
                 await self.close()
             else:
                 self.group_name = f'user_{self.user.username}'
@@ -17,49 +78,198 @@ class MainConsumer(AsyncWebsocketConsumer):
                     self.group_name,
                     self.channel_name
                 )
+                # Join the channel group of every user group the user is a member of
+                self.group_copies = await self.get_group_copies()
+                for user_group_id in self.group_copies:
+                    await self.channel_layer.group_add(group_channel_name(user_group_id), self.channel_name)
                 protocols = self.scope.get('subprotocols')
+                self.encoder = get_encoder(protocols[0])
                 await self.accept(subprotocol=protocols[0])
             
     async def disconnect(self, close_code):
+        if self.notifications_timer is not None:
+            self.notifications_timer.cancel()
+        for subscription in list(self.subscriptions.values()):
+            subscription.task.cancel()
+        self.subscriptions.clear()
         if self.user and self.user.is_authenticated:
             await self.channel_layer.group_discard(
                 self.group_name,
                 self.channel_name
             )
+            for user_group_id in self.group_copies:
+                await self.channel_layer.group_discard(group_channel_name(user_group_id), self.channel_name)
         else:
             await self.close(close_code)
         
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = json.loads(text_data) if text_data is not None else self.encoder.decode(bytes_data)
         message_type = text_data_json.get('type')
         
         if message_type == 'connection_init':
-            await self.send(text_data=json.dumps({'type': 'connection_ack'}))
+            await self.send_message({'type': 'connection_ack'})
+        elif message_type == 'ping':
+            await self.send_message({'type': 'pong'})
         elif message_type == 'subscribe':
-            self.subscription_id = text_data_json.get('id')
-            query = text_data_json.get('payload').get('query')
-            variables = text_data_json.get('payload').get('variables')
-            result = self.execute_query(query, variables)
-            async for item in result:
-                await self.send(text_data=json.dumps({
-                    'type': 'next',
-                    'id': self.subscription_id,
-                    'payload': item.data
-                }))
-
+            subscription_id = text_data_json.get('id')
+            if subscription_id in self.subscriptions:
+                await self.close(code=4409)
+                return
+            subscription = Subscription()
+            subscription.task = asyncio.create_task(self.run_subscription(subscription_id, text_data_json.get('payload') or {}, subscription))
+            self.subscriptions[subscription_id] = subscription
+        elif message_type == 'complete':
+            subscription = self.subscriptions.pop(text_data_json.get('id'), None)
+            if subscription is not None:
+                subscription.task.cancel()
         elif message_type == 'disconnect':
-            await self.send(text_data=json.dumps({'type': 'complete', 'id': text_data_json.get('id')}))
+            await self.send_message({'type': 'complete', 'id': text_data_json.get('id')})
             await self.close()
             
-    async def execute_query(self, query, variables):
-        result = await schema.subscribe(query, variables, context_value={'user': self.user})
+    async def run_subscription(self, subscription_id, payload, subscription):
+        """Sends the results of a subscription operation, then the broadcasts of the user until the subscription is completed.
+        The subscribe field may declare an event filter in the context, which selects the broadcasts.
+        With extensions.resumeFrom, the broadcasts missed since that sequence number are replayed first,
+        or a RESYNC_REQUIRED broadcast is sent when they are no longer available"""
+        context = {'user': self.user}
+        try:
+            try:
+                query = await database_sync_to_async(resolve_persisted_query)(payload.get('query'), payload.get('extensions'))
+                resume_from = get_resume_from(payload.get('extensions'))
+            except GraphQLError as error:
+                await self.send_error(subscription_id, [error.formatted])
+                return
+            async for item in self.execute_query(query, payload.get('variables'), context, payload.get('extensions')):
+                subscription.event_filter = context.get('event_filter')
+                if item.errors and item.data is None:
+                    await self.send_error(subscription_id, [error.formatted for error in item.errors])
+                    return
+                await self.send_next(subscription_id, item.data)
+            if resume_from is not None:
+                await self.replay_events(subscription_id, subscription, resume_from)
+            while True:
+                event = await subscription.queue.get()
+                if event is RESYNC_REQUIRED or subscription.matches(event):
+                    await self.send_next(subscription_id, event)
+        except Exception:
+            logger.exception('Subscription %s failed', subscription_id)
+            await self.send_error(subscription_id, [{'message': 'Internal server error'}])
+        finally:
+            # A completed subscription may have been replaced by a new one with the same id
+            if self.subscriptions.get(subscription_id) is subscription:
+                del self.subscriptions[subscription_id]
+
+    async def replay_events(self, subscription_id, subscription, resume_from):
+        streams = [self.group_name, *(group_channel_name(user_group_id) for user_group_id in self.group_copies)]
+        events, resync_required = await database_sync_to_async(get_missed_events)(streams, resume_from)
+        if resync_required:
+            await self.send_next(subscription_id, RESYNC_REQUIRED)
+            return
+        for event in events:
+            event_payload = self.get_group_payload(event) if event.get('type') == 'group_broadcast' else event
+            if event_payload is not None and subscription.matches(event_payload):
+                await self.send_next(subscription_id, event_payload)
+        if events:
+            subscription.last_seq = events[-1]['seq']
+
+    async def send_message(self, message):
+        if self.encoder.binary:
+            await self.send(bytes_data=self.encoder.encode(message))
+        else:
+            await self.send(text_data=self.encoder.encode(message))
+
+    async def send_next(self, subscription_id, payload):
+        await self.send_message({'type': 'next', 'id': subscription_id, 'payload': payload})
+
+    async def send_error(self, subscription_id, errors):
+        await self.send_message({'type': 'error', 'id': subscription_id, 'payload': errors})
+            
+    async def execute_query(self, query, variables, context, extensions=None):
+        document, errors = document_cache.get(schema.graphql_schema, query)
+        if document is None or errors:
+            yield ExecutionResult(data=None, errors=errors)
+            return
+        await database_sync_to_async(remember_persisted_query)(query, extensions, self.user)
+        result = await subscribe(schema.graphql_schema, document, variable_values=variables, context_value=context)
+        if isinstance(result, ExecutionResult):
+            yield result
+            return
         async for item in result:
             yield item
       
     async def broadcast(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'next',
-            'id': self.subscription_id,
-            'payload': event
-        }))
-        
\ No newline at end of file
+        if event.get('operation') == 'NOTIFICATION_CREATED' and self.hold_notification(event):
+            return
+        self.put_event(event)
+
+    def put_event(self, event):
+        for subscription in self.subscriptions.values():
+            subscription.put(event)
+
+    def hold_notification(self, event):
+        """Throttles the NOTIFICATION_CREATED broadcasts to one batch every NOTIFICATION_BROADCAST_INTERVAL seconds.
+        A broadcast within the interval is held back, and the latest one of each notification is sent when the interval ends"""
+        interval = getattr(settings, 'NOTIFICATION_BROADCAST_INTERVAL', 0)
+        if not interval:
+            return False
+        loop = asyncio.get_running_loop()
+        if self.notifications_timer is None and (self.notifications_sent_at is None or loop.time() - self.notifications_sent_at >= interval):
+            self.notifications_sent_at = loop.time()
+            return False
+        self.held_notifications[event['notification']['id']] = event
+        if self.notifications_timer is None:
+            self.notifications_timer = loop.call_at(self.notifications_sent_at + interval, self.send_held_notifications)
+        return True
+
+    def send_held_notifications(self):
+        held, self.held_notifications, self.notifications_timer = self.held_notifications, {}, None
+        self.notifications_sent_at = asyncio.get_running_loop().time()
+        for event in held.values():
+            self.put_event(event)
+        
+    async def group_broadcast(self, event):
+        """Sends an event of a user group channel, with the id of the user's own group copy filled in"""
+        payload = self.get_group_payload(event)
+        if payload is None:
+            return
+        if payload.get('operation') == 'GROUP_PERMANENTLY_REMOVED':
+            await self.group_leave(event)
+        await self.broadcast(payload)
+
+    def get_group_payload(self, event):
+        """The payload of a user group event for this user, or None if the user is not a member of the group.
+        An event about the copies of a group message is None as well when the user has no copy of it"""
+        group_copy_id = self.group_copies.get(event['group_id'])
+        if group_copy_id is None:
+            return None
+        group_message_ids = event.get('group_message_ids')
+        if group_message_ids is not None and str(group_copy_id) not in group_message_ids:
+            return None
+        group_copy_global_id = Node.to_global_id('UserGroupMemberCopyType', group_copy_id)
+        # The event is shared by all the consumers of the group, so it is copied before filling in the group copy
+        payload = {key: value for key, value in event.items() if key not in ('group_id', 'group_message_ids')}
+        payload['type'] = 'broadcast'
+        if 'groupCopy' in payload:
+            payload['groupCopy'] = {**payload['groupCopy'], 'id': group_copy_global_id}
+        if 'groupMessage' in payload:
+            payload['groupMessage'] = {**payload['groupMessage'], 'groupCopy': {'id': group_copy_global_id}}
+            if group_message_ids is not None:
+                payload['groupMessage']['id'] = group_message_ids[str(group_copy_id)]
+        return payload
+        
+    async def group_join(self, event):
+        """Joins the channel group of a user group the user was added to"""
+        self.group_copies[event['group_id']] = event['group_copy_id']
+        await self.channel_layer.group_add(group_channel_name(event['group_id']), self.channel_name)
+        if event.get('event'):
+            await self.group_broadcast({**event['event'], 'group_id': event['group_id']})
+        
+    async def group_leave(self, event):
+        """Leaves the channel group of a user group the user is no longer a member of"""
+        self.group_copies.pop(event['group_id'], None)
+        await self.channel_layer.group_discard(group_channel_name(event['group_id']), self.channel_name)
+        
+    @database_sync_to_async
+    def get_group_copies(self):
+        """Maps the ids of the user groups of the user to the ids of the user's group copies"""
+        return dict(UserGroupMemberCopy.objects.filter(member__member=self.user).values_list('member__user_group_id', 'id'))
@@ -0,0 +1,48 @@
+import json
+import msgpack
+
+COMPACT_SUBPROTOCOL = 'graphql-transport-ws.msgpack'
+
+class JSONEncoder:
+    """The default graphql-transport-ws encoding, a JSON text frame per message"""
+    binary = False
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, data):
+        return json.loads(data)
+
+class CompactEncoder:
+    """Encodes the messages as MessagePack binary frames whose map keys are indexes into a dictionary of the connection.
+    A frame is [new keys, message], the client appends the new keys to its dictionary before reading the message.
+    The keys repeat across the events, so after the first events of a connection the frames only carry the values"""
+    binary = True
+
+    def __init__(self):
+        self.keys = {}
+
+    def encode(self, message):
+        new_keys = []
+        return msgpack.packb([new_keys, self.compact(message, new_keys)])
+
+    def compact(self, value, new_keys):
+        if isinstance(value, dict):
+            return {self.key_index(key, new_keys): self.compact(item, new_keys) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.compact(item, new_keys) for item in value]
+        return value
+
+    def key_index(self, key, new_keys):
+        index = self.keys.get(key)
+        if index is None:
+            index = self.keys[key] = len(self.keys)
+            new_keys.append(key)
+        return index
+
+    def decode(self, data):
+        # The client messages are few, so they are plain MessagePack maps
+        return msgpack.unpackb(data)
+
+def get_encoder(subprotocol):
+    return CompactEncoder() if subprotocol == COMPACT_SUBPROTOCOL else JSONEncoder()
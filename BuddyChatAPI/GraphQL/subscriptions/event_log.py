@@ -0,0 +1,46 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Max, Min
+from django.utils import timezone
+from ...models import EventLog, EventSequence
+
+# Control messages such as group_join are not sent to the clients, so they are not logged
+LOGGED_TYPES = ('broadcast', 'group_broadcast')
+
+def reserve_sequence(count):
+    """Reserves count sequence numbers in the database, and returns the first one.
+    The sequence row stays locked until the transaction ends, so the batches are logged in the order of their numbers"""
+    if not EventSequence.objects.filter(pk=1).update(last=F('last') + count):
+        EventSequence.objects.get_or_create(pk=1, defaults={'last': EventLog.objects.aggregate(seq=Max('seq'))['seq'] or 0})
+        EventSequence.objects.filter(pk=1).update(last=F('last') + count)
+    return EventSequence.objects.values_list('last', flat=True).get(pk=1) - count + 1
+
+def log_events(events):
+    """Stamps a sequence number on the broadcasts of a batch of (group, message) events and stores them in a single insert.
+    It runs in the transaction of the caller, which holds the sequence until it commits"""
+    logged = [(group, message) for group, message in events if message.get('type') in LOGGED_TYPES]
+    if not logged:
+        return
+    first = reserve_sequence(len(logged))
+    for seq, (_, message) in enumerate(logged, start=first):
+        message['seq'] = seq
+    EventLog.objects.bulk_create([EventLog(stream=group, seq=message['seq'], event=message) for group, message in logged])
+
+def get_missed_events(streams, resume_from):
+    """Returns the events of the streams after the resume_from sequence number, and whether the client has to resync instead.
+    It has to when events after resume_from were pruned, or when it missed more than EVENT_LOG_REPLAY_LIMIT events"""
+    limit = getattr(settings, 'EVENT_LOG_REPLAY_LIMIT', 500)
+    oldest = EventLog.objects.aggregate(seq=Min('seq'))['seq']
+    if oldest is not None and resume_from < oldest - 1:
+        return [], True
+    events = list(EventLog.objects.filter(stream__in=streams, seq__gt=resume_from).order_by('seq').values_list('event', flat=True)[:limit + 1])
+    if len(events) > limit:
+        return [], True
+    return events, False
+
+def prune_event_log():
+    """Deletes the events older than EVENT_LOG_RETENTION seconds. The newest event is kept, so the log always tells where it starts"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'EVENT_LOG_RETENTION', 86400))
+    newest = EventLog.objects.order_by('-seq').values_list('seq', flat=True).first()
+    deleted, _ = EventLog.objects.filter(created_at__lt=cutoff).exclude(seq=newest).delete()
+    return deleted
@@ -0,0 +1,25 @@
+def get_conversation_id(event):
+    """The global id of the chat or group copy a broadcast is about, or None"""
+    for key in ('chat', 'groupCopy'):
+        if isinstance(event.get(key), dict):
+            return event[key].get('id')
+    for message_key, key in (('chatMessage', 'chat'), ('groupMessage', 'groupCopy')):
+        message = event.get(message_key)
+        if isinstance(message, dict):
+            return (message.get(key) or {}).get('id')
+    return None
+
+class EventFilter:
+    """The broadcasts a subscription asked for, by operation and by chat or group copy.
+    When ids are given, the broadcasts that are not about a chat or group copy are left out"""
+    def __init__(self, operations=None, chat_ids=None, group_copy_ids=None):
+        self.operations = set(operations) if operations else None
+        # The global ids of chats and group copies never collide, so they are matched together
+        self.conversation_ids = set(chat_ids or ()) | set(group_copy_ids or ()) or None
+
+    def matches(self, event):
+        if self.operations is not None and event.get('operation') not in self.operations:
+            return False
+        if self.conversation_ids is not None and get_conversation_id(event) not in self.conversation_ids:
+            return False
+        return True
@@ -1,10 +1,75 @@
-from django.contrib.auth import get_user_model
+import time
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from channels.db import database_sync_to_async
+from graphql_jwt.refresh_token.signals import refresh_token_revoked
 from graphql_jwt.utils import jwt_decode
-from django.core.exceptions import PermissionDenied
 from channels.middleware import BaseMiddleware
+from ..user_cache import user_cache
 from ...models import CustomUser
 
+class TokenCache:
+    """Bounded cache of the verified tokens to the id of their user. An entry is kept until its token expires,
+    so a client that reconnects with the same token is authenticated without decoding it again"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.tokens = OrderedDict()
+        self.user_tokens = {}
+        self.lock = Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                self.remove(token)
+                return None
+            self.tokens.move_to_end(token)
+            return user_id
+
+    def set(self, token, user_id, expires_at):
+        with self.lock:
+            self.tokens[token] = (user_id, expires_at)
+            self.user_tokens.setdefault(user_id, set()).add(token)
+            while len(self.tokens) > self.max_size:
+                self.remove(next(iter(self.tokens)))
+
+    def remove(self, token):
+        user_id, _ = self.tokens.pop(token)
+        tokens = self.user_tokens.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.user_tokens[user_id]
+
+    def revoke_user(self, user_id):
+        """Forgets the tokens of a user, they are verified again on the next connection"""
+        with self.lock:
+            for token in list(self.user_tokens.get(user_id, ())):
+                self.remove(token)
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+            self.user_tokens.clear()
+
+token_cache = TokenCache(getattr(settings, 'WEBSOCKET_TOKEN_CACHE_SIZE', 10000))
+
+@receiver(refresh_token_revoked)
+def revoke_refresh_token_user(refresh_token, **kwargs):
+    token_cache.revoke_user(refresh_token.user_id)
+
+# A password change, a deactivation or a deletion saves the user. Only the tokens cached by this process are forgotten
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def revoke_saved_user(instance, **kwargs):
+    token_cache.revoke_user(instance.pk)
+
 class JWTAuthMiddleware(BaseMiddleware):
     """Custom middleware to authenticate WebSocket connections using JWT."""
 
@@ -19,26 +84,29 @@ class JWTAuthMiddleware(BaseMiddleware):
                 token = header[1].decode("utf-8").split("JWT ")[-1]
                 break
 
-        # If a token is provided, decode it using graphql-jwt
-        if token:
-            try:
-                payload = jwt_decode(token)
-                # Attach the user to the scope
-                scope['user'] = self.get_user_from_payload(payload)
-            except Exception as e:
-                # Return a permission denied error if the token is invalid
-                scope['user'] = None
-        else:
-            scope['user'] = None
-
+        # The consumer awaits the user when it connects
+        scope['user'] = self.get_user(token) if token else None
         return super().__call__(scope, receive, send)
 
+    async def get_user(self, token):
+        """Returns the user of a token, or None if the token is invalid. A known token is resolved by the primary key of its user,
+        and without blocking while the user is in the process cache"""
+        user_id = token_cache.get(token)
+        if user_id is not None:
+            user = user_cache.get_local_user(user_id) or await database_sync_to_async(user_cache.get)(user_id)
+            # The tokens are only forgotten by the process that saved the user, the others see the deactivation here
+            return user if user is not None and user.is_active else None
+        try:
+            payload = jwt_decode(token)
+        except Exception:
+            return None
+        user = await self.get_user_from_payload(payload)
+        if user is not None and user.is_active:
+            token_cache.set(token, user.pk, payload['exp'])
+            return user
+        return None
+
     @database_sync_to_async
     def get_user_from_payload(self, payload):
         """Helper function to get the user from the payload."""
-        
-        try:
-            user = CustomUser.objects.get(username=payload['username'])
-        except CustomUser.DoesNotExist:
-            return None
-        return user
+        return user_cache.get_by_username(payload['username'])
@@ -0,0 +1,76 @@
+from functools import partial
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from .event_log import log_events
+
+class Outbox:
+    """Collects the channel layer events published in a transaction, in the order they were published, and sends them as one batch once it is committed.
+    Each event is tagged with the savepoints it was published in. Every savepoint registers a commit callback, which Django drops when the savepoint
+    is rolled back, so only the events of the savepoints whose callback ran are sent"""
+    def __init__(self):
+        self.events = []
+        self.committed = set()
+        self.generation = 0
+
+    def is_pending(self, db_connection):
+        # Django drops the commit callbacks of rolled back transactions
+        return any(getattr(callback, 'func', None) == self.flush for callback in pending_callbacks(db_connection))
+
+    def add(self, db_connection, group, message):
+        key = tuple(db_connection.savepoint_ids)
+        if not any(event_key == key for event_key, *_ in self.events):
+            transaction.on_commit(partial(self.committed.add, key), robust=True)
+            # The flush is registered again after the callback of each savepoint, and only the last one sends
+            self.generation += 1
+            on_transaction_commit(db_connection, partial(self.flush, self.generation))
+        self.events.append((key, group, message))
+
+    def flush(self, generation):
+        if generation != self.generation:
+            return
+        events = [(group, message) for key, group, message in self.events if key in self.committed]
+        self.events, self.committed = [], set()
+        if events:
+            deliver_events(events)
+
+def on_transaction_commit(db_connection, func):
+    """Registers func like transaction.on_commit, but outside the current savepoints, so only a rollback of the whole transaction drops it"""
+    transaction.on_commit(func, robust=True)
+    savepoint_ids, *_ = commit_hooks(db_connection)[-1]
+    savepoint_ids.clear()
+
+def pending_callbacks(db_connection):
+    """Returns the commit callbacks registered in the current transaction"""
+    return [callback for _, callback, *_ in commit_hooks(db_connection)]
+
+def commit_hooks(db_connection):
+    """Django keeps the commit callbacks in a private list of (savepoint ids, callback, robust) tuples. This is the only place that accesses it,
+    and test_outbox checks its layout"""
+    return db_connection.run_on_commit
+
+def deliver_events(events):
+    """Logs the events, then sends them. The sequence of the event log is only locked while the events are logged, so the
+    batches are sent in any order and the consumers order them by their sequence numbers. A logged event is in the log before it is sent"""
+    with transaction.atomic():
+        log_events(events)
+    async_to_sync(send_events)(events)
+
+async def send_events(events):
+    """Sends the events through a single sync to async bridge, in the order they were published"""
+    channel_layer = get_channel_layer()
+    for group, message in events:
+        await channel_layer.group_send(group, message)
+
+def publish(group, message):
+    """Sends an event to a channel layer group once the current transaction is committed.
+    Events of a rolled back transaction are never sent, and outside a transaction the event is sent right away.
+    The broadcasts are stored in the event log with their sequence number before they are sent"""
+    db_connection = transaction.get_connection()
+    if not db_connection.in_atomic_block:
+        deliver_events([(group, message)])
+        return
+    outbox = getattr(db_connection, 'outbox', None)
+    if outbox is None or not outbox.is_pending(db_connection):
+        outbox = db_connection.outbox = Outbox()
+    outbox.add(db_connection, group, message)
@@ -1,7 +1,6 @@
 from django.db.models.signals import ModelSignal
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .outbox import publish
 from graphene.relay import Node
 
 on_message_created = ModelSignal(use_caching=True)
@@ -9,13 +8,51 @@ on_message_updated = ModelSignal(use_caching=True)
 on_message_deleted = ModelSignal(use_caching=True)
 on_message_unsent = ModelSignal(use_caching=True)
 on_notification_created = ModelSignal(use_caching=True)
+on_notifications_read = ModelSignal(use_caching=True)
 on_message_read = ModelSignal(use_caching=True)
+on_chat_read = ModelSignal(use_caching=True)
 on_chat_deleted = ModelSignal(use_caching=True)
 on_group_updated = ModelSignal(use_caching=True)
 on_group_removed = ModelSignal(use_caching=True)
 on_member_added = ModelSignal(use_caching=True)
 on_member_removed = ModelSignal(use_caching=True)
 
+def group_channel_name(user_group_id):
+    return f'group_{user_group_id}'
+
+# Group events are sent once to the channel group of the user group instead of once per member.
+# Each consumer fills in the id of its own group copy before sending the event to the client
+def broadcast_to_group(user_group_id, event):
+    publish(
+        group_channel_name(user_group_id),
+        {
+            'type': 'group_broadcast',
+            'group_id': user_group_id,
+            **event
+        }
+    )
+
+# Ask the consumers of a user to join or leave the channel group of a user group
+def join_group_channel(username, user_group_id, group_copy_id, event=None):
+    publish(
+        f'user_{username}',
+        {
+            'type': 'group_join',
+            'group_id': user_group_id,
+            'group_copy_id': group_copy_id,
+            'event': event,
+        }
+    )
+
+def leave_group_channel(username, user_group_id):
+    publish(
+        f'user_{username}',
+        {
+            'type': 'group_leave',
+            'group_id': user_group_id,
+        }
+    )
+
 # Helper function to define the operation, message_holder, message_type, chat_type, and chat_id based on the chat type
 def define_variables(instance, operation_suffix, is_chat=False, is_message=False) -> tuple[str, str, str, str, int, str]:
     if not is_message:
@@ -46,14 +83,13 @@ def define_message_variables(is_chat_message, instance, operation_suffix) -> tup
         message_type = 'GroupMessageType'
         chat_type = 'UserGroupMemberCopyType'
         chat_key = 'groupCopy'
-        if instance:
-            chat_id = instance.user_group_copy.id        
+        if instance and instance.user_group_copy_id:
+            chat_id = instance.user_group_copy.id
     return operation, message_holder, message_type, chat_type, chat_id, chat_key
 
 # A generic function to broadcast a message eihther created, updated
-def broadcast_message(instance, is_chat, operation_suffix, add_message_details=False, **kwargs):
+def broadcast_message(instance, is_chat, operation_suffix, add_message_details=False, group_message_ids=None, **kwargs):
     operation, message_holder, message_type, chat_type, chat_id, chat_key = define_variables(instance, operation_suffix, is_chat, is_message=True)
-    channel_layer = get_channel_layer()
     if add_message_details:
         message = {
             'id': Node.to_global_id('MessageType', instance.message.id),
@@ -65,11 +101,35 @@ def broadcast_message(instance, is_chat, operation_suffix, add_message_details=F
         }
     else:
         message = None
+    # Timeline group messages are the same for every member, so they are sent once to the group
+    if not is_chat and instance.user_group_id:
+        broadcast_to_group(instance.user_group_id, {
+            'operation': operation,
+            message_holder: {
+                'id': Node.to_global_id(message_type, instance.id),
+                'message': message,
+                chat_key: {},
+            }
+        })
+        return
+    # The copies of a group message are sent once to the group too, with the id of each member's copy by group copy id
+    if group_message_ids is not None:
+        broadcast_to_group(instance.user_group_copy.member.user_group_id, {
+            'operation': operation,
+            'group_message_ids': {
+                str(group_copy_id): Node.to_global_id(message_type, group_message_id) for group_copy_id, group_message_id in group_message_ids.items()
+            },
+            message_holder: {
+                'message': message,
+                chat_key: {},
+            }
+        })
+        return
     if is_chat:
         username = instance.chat.user.username
     else:
         username = instance.user_group_copy.member.member.username
-    async_to_sync(channel_layer.group_send)(
+    publish(
         f'user_{username}',
         {
             'type': 'broadcast',
@@ -89,8 +149,8 @@ def broadcast_created_message(instance, is_chat, **kwargs):
     broadcast_message(instance, is_chat, 'CREATED', add_message_details=True)
     
 @receiver(on_message_updated)
-def broadcast_updated_message(instance, is_chat, **kwargs):
-    broadcast_message(instance, is_chat, 'UPDATED', add_message_details=True)
+def broadcast_updated_message(instance, is_chat, group_message_ids=None, **kwargs):
+    broadcast_message(instance, is_chat, 'UPDATED', add_message_details=True, group_message_ids=group_message_ids)
     
 @receiver(on_message_unsent)
 def broadcast_unsent_message(instance, is_chat, **kwargs):
@@ -99,8 +159,7 @@ def broadcast_unsent_message(instance, is_chat, **kwargs):
 @receiver(on_message_deleted)
 def broadcast_deleted_message(message_id, is_chat, chat_id, username, **kwargs):
     operation, message_holder, message_type, chat_type, _, chat_key = define_message_variables(is_chat, None, 'DELETED')
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    publish(
         f'user_{username}',
         {
             'type': 'broadcast',
@@ -118,16 +177,51 @@ def broadcast_deleted_message(message_id, is_chat, chat_id, username, **kwargs):
 def broadcast_read_message(instance, is_chat, **kwargs):
     broadcast_message(instance, is_chat, 'READ')
 
+def read_until_payload(read_until, read_until_message_id):
+    return {
+        'date': read_until.isoformat(),
+        'messageId': Node.to_global_id('MessageType', read_until_message_id),
+    }
+
+# A single event tells that every message up to the watermark is read, instead of one event per message
+@receiver(on_chat_read)
+def broadcast_read_chat(instance, is_chat, other_chat=None, **kwargs):
+    if not is_chat:
+        broadcast_to_group(instance.member.user_group_id, {
+            'operation': 'GROUP_READ',
+            'groupCopy': {
+                'member': {
+                    'id': Node.to_global_id('GroupMemberType', instance.member_id),
+                },
+                'readUntil': read_until_payload(instance.read_until, instance.read_until_message_id),
+            }
+        })
+        return
+    if other_chat is None:
+        return
+    publish(
+        f'user_{other_chat.user.username}',
+        {
+            'type': 'broadcast',
+            'operation': 'CHAT_READ',
+            'chat': {
+                'id': Node.to_global_id('ChatType', other_chat.id),
+                'otherReadUntil': read_until_payload(instance.read_until, instance.read_until_message_id),
+            }
+        }
+    )
+
+# Every change of a notification is published once committed, the consumers of the receiver throttle them
 @receiver(on_notification_created)
 def broadcast_created_notification(instance, **kwargs):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    publish(
         f'user_{instance.receiver.username}',
         {
             'type': 'broadcast',
             'operation': 'NOTIFICATION_CREATED',
             'notification': {
                 'id': Node.to_global_id('NotificationType', instance.id),
+                'count': instance.count,
                 'message': {
                     'id': Node.to_global_id('MessageType', instance.message.id),
                     'content': instance.message.content,
@@ -139,12 +233,29 @@ def broadcast_created_notification(instance, **kwargs):
         }
     )
     
+# Notifications read together are announced by a single event with the filter they were read by
+@receiver(on_notifications_read)
+def broadcast_read_notifications(user, count, notification_id=None, chat_id=None, group_copy_id=None, until=None, **kwargs):
+    publish(
+        f'user_{user.username}',
+        {
+            'type': 'broadcast',
+            'operation': 'NOTIFICATIONS_READ',
+            'notifications': {
+                'count': count,
+                'id': notification_id,
+                'chatId': chat_id,
+                'groupCopyId': group_copy_id,
+                'until': until.isoformat() if until else None,
+            }
+        }
+    )
+    
 @receiver(on_chat_deleted)
 def broadcast_deleted_chat(instance, is_chat, **kwargs):
     operation, message_holder, message_type, chat_type, chat_id, chat_key = define_variables(instance, 'DELETED', is_chat)
-    channel_layer = get_channel_layer()
     username = instance.user.username if is_chat else instance.member.member.username
-    async_to_sync(channel_layer.group_send)(
+    publish(
         f'user_{username}',
         {
             'type': 'broadcast',
@@ -157,71 +268,52 @@ def broadcast_deleted_chat(instance, is_chat, **kwargs):
 
 @receiver(on_group_updated)
 def broadcast_updated_group(instance, **kwargs):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'user_{instance.member.member.username}',
-        {
-            'type': 'broadcast',
-            'operation': 'GROUP_UPDATED',
-            'groupCopy': {
-                'id': Node.to_global_id('UserGroupMemberCopyType', instance.id),
-                'group': {
-                    'id': Node.to_global_id('UserGroupType', instance.member.user_group.id),
-                    'title': instance.member.user_group.title,
-                    'description': instance.member.user_group.description,
-                    'groupImage': instance.member.user_group.group_image.url,
-                }
+    broadcast_to_group(instance.id, {
+        'operation': 'GROUP_UPDATED',
+        'groupCopy': {
+            'group': {
+                'id': Node.to_global_id('UserGroupType', instance.id),
+                'title': instance.title,
+                'description': instance.description,
+                'groupImage': instance.group_image.url,
             }
         }
-    )
+    })
     
 @receiver(on_group_removed)
-def broadcast_removed_group(username, group_id, **kwargs):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'user_{username}',
-        {
-            'type': 'broadcast',
-            'operation': 'GROUP_PERMANENTLY_REMOVED',
-            'groupId': group_id
-        }
-    )
+def broadcast_removed_group(user_group_id, group_id, **kwargs):
+    broadcast_to_group(user_group_id, {
+        'operation': 'GROUP_PERMANENTLY_REMOVED',
+        'groupId': group_id
+    })
     
 @receiver(on_member_added)
-def broadcast_added_member(member_copy, new_member, username, **kwargs):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'user_{username}',
-        {
-            'type': 'broadcast',
-            'operation': 'MEMBER_ADDED',
-            'groupCopy': {
-                'id': Node.to_global_id('UserGroupMemberCopyType', member_copy.id),
-                'member': {
-                    'id': Node.to_global_id('GroupMemberType', new_member.id),
-                    'joinedAt': new_member.joined_at.isoformat(),
-                    'group_id': Node.to_global_id('UserGroupType', new_member.user_group.id),
-                    'user': {
-                        'id': Node.to_global_id('CustomUserType', new_member.member.id),
-                        'username': new_member.member.username
-                    },
-                }
+def broadcast_added_member(new_member, member_copy, **kwargs):
+    event = {
+        'operation': 'MEMBER_ADDED',
+        'groupCopy': {
+            'member': {
+                'id': Node.to_global_id('GroupMemberType', new_member.id),
+                'joinedAt': new_member.joined_at.isoformat(),
+                'group_id': Node.to_global_id('UserGroupType', new_member.user_group_id),
+                'user': {
+                    'id': Node.to_global_id('CustomUserType', new_member.member.id),
+                    'username': new_member.member.username
+                },
             }
         }
-    )
+    }
+    broadcast_to_group(new_member.user_group_id, event)
+    # The new member is not in the channel group yet, so the event is forwarded once it joins
+    join_group_channel(new_member.member.username, new_member.user_group_id, member_copy.id, event)
     
 @receiver(on_member_removed)
-def broadcast_removed_member(member_copy, member_id, username, removed_by_id=None, left=False, **kwargs):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'user_{username}',
-        {
-            'type': 'broadcast',
-            'operation': 'MEMBER_LEFT' if left else 'MEMBER_REMOVED',
-            'groupCopy': {
-                'id': Node.to_global_id('UserGroupMemberCopyType', member_copy.id),
-                'member_id': member_id,
-            },
-            'removedById': Node.to_global_id('CustomUserType', removed_by_id) if removed_by_id else None
-        }
-    )
\ No newline at end of file
+def broadcast_removed_member(user_group_id, member_id, username, removed_by_id=None, left=False, **kwargs):
+    broadcast_to_group(user_group_id, {
+        'operation': 'MEMBER_LEFT' if left else 'MEMBER_REMOVED',
+        'groupCopy': {
+            'member_id': member_id,
+        },
+        'removedById': Node.to_global_id('CustomUserType', removed_by_id) if removed_by_id else None
+    })
+    leave_group_channel(username, user_group_id)
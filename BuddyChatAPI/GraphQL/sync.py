@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from graphql_relay.utils import base64, unbase64
+from ..models import Chat, ChatMessage, Deletion, GroupMessage, Notification, UserGroupMemberCopy
+
+def encode_sync_cursor(date):
+    return base64(f'sync|{date.isoformat()}')
+
+def decode_sync_cursor(cursor):
+    try:
+        prefix, date = unbase64(cursor).split('|')
+        if prefix != 'sync':
+            raise ValueError
+        return datetime.fromisoformat(date)
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+
+def changed_message_copies(copies, since):
+    """The message copies that changed after since, or whose message did, e.g. when it was edited or read.
+    Each condition is its own query on an indexed updated_at, an OR across the join could use neither index"""
+    return copies.filter(updated_at__gt=since).order_by().union(copies.filter(message__updated_at__gt=since).order_by())
+
+def get_changed_rows(user, since):
+    """The querysets of the rows of a user that changed after since, by name"""
+    group_copies = list(UserGroupMemberCopy.objects.filter(member__member=user).select_related('member__user_group'))
+    group_messages = GroupMessage.objects.filter(user_group_copy__member__member=user)
+    for group_copy in group_copies:
+        if group_copy.member.user_group.is_timeline:
+            group_messages |= group_copy.visible_group_messages()
+    return {
+        'chats': Chat.objects.filter(user=user, updated_at__gt=since),
+        'groups': UserGroupMemberCopy.objects.filter(Q(updated_at__gt=since) | Q(member__user_group__updated_at__gt=since), member__member=user),
+        'chat_messages': changed_message_copies(ChatMessage.objects.filter(chat__user=user), since),
+        'group_messages': changed_message_copies(group_messages, since),
+        'notifications': Notification.objects.filter(receiver=user, updated_at__gt=since),
+        'deletions': Deletion.objects.filter(Q(user=user) | Q(user_group__in=[group_copy.member.user_group_id for group_copy in group_copies]), deleted_at__gt=since),
+    }
+
+def get_changes(user, cursor=None):
+    """The rows of a user that changed since the cursor, and the cursor of the next call. Without a cursor only the cursor is returned.
+    The client has to resync instead when the cursor is older than the kept tombstones, or when more than SYNC_CHANGES_LIMIT rows of a kind changed"""
+    now = timezone.now()
+    changes = {'cursor': encode_sync_cursor(now), 'resync_required': False}
+    if cursor is None:
+        return changes
+    since = decode_sync_cursor(cursor)
+    if since < now - timedelta(seconds=getattr(settings, 'DELETION_RETENTION', 2592000)):
+        return {**changes, 'resync_required': True}
+    # The rows written by the transactions that were still running at the previous call have an earlier updated_at, so they are read again
+    since -= timedelta(seconds=getattr(settings, 'SYNC_CURSOR_OVERLAP', 5))
+    limit = getattr(settings, 'SYNC_CHANGES_LIMIT', 500)
+    for name, queryset in get_changed_rows(user, since).items():
+        rows = list(queryset.order_by('pk')[:limit + 1])
+        if len(rows) > limit:
+            return {'cursor': changes['cursor'], 'resync_required': True}
+        changes[name] = rows
+    return changes
+
+def prune_deletions():
+    """Deletes the tombstones older than DELETION_RETENTION seconds, changesSince asks the clients with an older cursor to resync"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'DELETION_RETENTION', 2592000))
+    deleted, _ = Deletion.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
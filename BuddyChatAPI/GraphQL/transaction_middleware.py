@@ -0,0 +1,12 @@
+from django.db import transaction
+
+class AtomicMutationMiddleware:
+    """Runs each root mutation in its own transaction. A failing mutation leaves no partial writes behind,
+    and the events it published are dropped with the transaction instead of being broadcast"""
+    def resolve(self, next, root, info, **kwargs):
+        if info.parent_type != info.schema.mutation_type:
+            return next(root, info, **kwargs)
+        with transaction.atomic():
+            return next(root, info, **kwargs)
+
+atomic_mutation_middleware = AtomicMutationMiddleware()
@@ -2,9 +2,39 @@ from graphene_django import DjangoObjectType
 from ..models import *
 import graphene
 from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.fields import DjangoConnectionField
 from graphql_jwt.decorators import login_required
 from django.core.exceptions import PermissionDenied
-class CustomUserType(DjangoObjectType):
+from graphql.language import OperationType
+from .loaders import get_loaders, related_resolver
+from .pagination import keyset_connection
+from .chat_list import get_chats
+from .user_cache import user_cache
+
+class BatchedDjangoObjectType(DjangoObjectType):
+    """Base type of the model types. Nodes and foreign keys are resolved through the loaders of the request,
+    so the queries of a response do not grow with the number of its edges"""
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def __init_subclass_with_meta__(cls, **options):
+        super().__init_subclass_with_meta__(**options)
+        model_fields = {field.name: field for field in cls._meta.model._meta.concrete_fields}
+        for name in cls._meta.fields:
+            field = model_fields.get(name)
+            if field and field.is_relation and not hasattr(cls, f'resolve_{name}'):
+                setattr(cls, f'resolve_{name}', staticmethod(related_resolver(name)))
+
+    @classmethod
+    def get_node(cls, info, id):
+        # Mutations change the rows they load, so their nodes are always read from the database
+        if info.operation.operation != OperationType.QUERY:
+            return super().get_node(info, id)
+        model = cls._meta.model
+        return get_loaders(info).load(model, model._meta.pk.to_python(id))
+
+class CustomUserType(BatchedDjangoObjectType):
     """The user type. It contains the user's information"""
     class Meta:
         model = CustomUser
@@ -16,6 +46,11 @@ class CustomUserType(DjangoObjectType):
     phone_numbers = graphene.List('BuddyChatAPI.GraphQL.types.PhoneNumberType')
     chats = DjangoFilterConnectionField('BuddyChatAPI.GraphQL.types.ChatType', fields=['archived'], max_limit=20)
     
+    @classmethod
+    def get_node(cls, info, id):
+        # Users rarely change, so they are read through the user cache
+        return user_cache.get(cls._meta.model._meta.pk.to_python(id))
+    
     @login_required
     def resolve_notifications(self, info):
         if self == info.context.user:
@@ -35,13 +70,13 @@ class CustomUserType(DjangoObjectType):
         raise PermissionDenied('Only the user can view their phone numbers')
     
     @login_required
-    def resolve_chats(self, info):
+    def resolve_chats(self, info, **kwargs):
         if self == info.context.user:
-            return self.chats.all()
+            return get_chats(self.id, **kwargs)
         raise PermissionDenied('Only the user can view their chats')
 
         
-class PhoneNumberType(DjangoObjectType):
+class PhoneNumberType(BatchedDjangoObjectType):
     class Meta:
         model = PhoneNumber
         fields = "__all__"
@@ -51,7 +86,7 @@ class PhoneNumberInputType(graphene.InputObjectType):
     number = graphene.String(required=True)
     country_code = graphene.String(required=True)
 
-class MessageType(DjangoObjectType):
+class MessageType(BatchedDjangoObjectType):
     """The root message type which is the dependent type for the chat message and group message types"""
     class Meta:
         model = Message
@@ -59,56 +94,143 @@ class MessageType(DjangoObjectType):
         interfaces = (graphene.relay.Node, )
         
 
-class ChatType(DjangoObjectType):
+class ChatType(BatchedDjangoObjectType):
     """The chat type. Each user has a chat copy for each other user they have chatted with"""
     class Meta:
         model = Chat
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
+
+    message_timeline = graphene.Field(
+        'BuddyChatAPI.GraphQL.types.ChatMessageTimelineConnection',
+        first=graphene.Int(),
+        after=graphene.String(),
+        description="The chat messages from the newest to the oldest, paginated by cursor"
+    )
+
+    def resolve_message_timeline(self, info, first=None, after=None):
+        return keyset_connection(ChatMessageTimelineConnection, self.chat_messages.all(), first, after)
         
-class ChatMessageType(DjangoObjectType):
+class ChatMessageType(BatchedDjangoObjectType):
     """The chat message type. It contains the chat message information"""
     class Meta:
         model = ChatMessage
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
 
-class UserGroupType(DjangoObjectType):
+    is_read = graphene.Boolean(description="Whether the receiver has read the message, derived from the read watermarks of the chat")
+
+    def resolve_is_read(self, info):
+        loaders = get_loaders(info)
+        chat = loaders.load_related(self, 'chat')
+        if loaders.load_related(self, 'message').read_at is not None:
+            return True
+        # A sent message is read when the other user's watermark covers it, which is mirrored on the chat
+        if self.sender_id == chat.user_id and chat.other_user_id != chat.user_id:
+            return watermark_covers(chat.other_read_until, chat.other_read_until_message_id, self)
+        return watermark_covers(chat.read_until, chat.read_until_message_id, self)
+
+class UserGroupType(BatchedDjangoObjectType):
     """The root user group type. It contains the main information. GroupMemberType depends on this type"""
     class Meta:
         model = UserGroup
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
-class GroupMessageType(DjangoObjectType):
+class GroupMessageType(BatchedDjangoObjectType):
     """The group message type. It contains the group message information"""
     class Meta:
         model = GroupMessage
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
-class GroupMemberType(DjangoObjectType):
+
+    is_read = graphene.Boolean(description="Whether the current user has read the message, derived from the read watermark of their group copy")
+
+    def resolve_is_read(self, info):
+        loaders = get_loaders(info)
+        if loaders.load_related(self, 'message').read_at is not None:
+            return True
+        if self.user_group_copy_id:
+            group_copy = loaders.load_related(self, 'user_group_copy')
+        else:
+            # The timeline messages are shared, so the watermark is the one of the current user's copy
+            group_copy = loaders.memoize(
+                ('group_copy', self.user_group_id),
+                lambda: UserGroupMemberCopy.objects.filter(member__user_group_id=self.user_group_id, member__member_id=info.context.user.id).first()
+            )
+        return group_copy is not None and group_copy.has_read(self)
+class GroupMemberType(BatchedDjangoObjectType):
     """The group member type. It contains the group member information"""
     class Meta:
         model = GroupMember
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
         
-class AttachmentType(DjangoObjectType):
+class AttachmentType(BatchedDjangoObjectType):
     class Meta:
         model = Attachment
         fields = "__all__"
         
-class NotificationType(DjangoObjectType):
+class NotificationType(BatchedDjangoObjectType):
     class Meta:
         model = Notification
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
 
-class UserGroupMemberCopyType(DjangoObjectType):
+class UserGroupMemberCopyType(BatchedDjangoObjectType):
     """The user group member copy type. The user copy of the group, so that each user can have a copy of the group messages"""
     class Meta:
         model = UserGroupMemberCopy
         fields = "__all__"
         interfaces = (graphene.relay.Node, )
+        
+    group_messages = DjangoConnectionField('BuddyChatAPI.GraphQL.types.GroupMessageType')
+    message_timeline = graphene.Field(
+        'BuddyChatAPI.GraphQL.types.GroupMessageTimelineConnection',
+        first=graphene.Int(),
+        after=graphene.String(),
+        description="The group messages visible to the copy from the newest to the oldest, paginated by cursor"
+    )
+    
+    def resolve_group_messages(self, info, **kwargs):
+        return self.visible_group_messages()
+
+    def resolve_message_timeline(self, info, first=None, after=None):
+        return keyset_connection(GroupMessageTimelineConnection, self.visible_group_messages(), first, after)
+    
+    def resolve_last_message(self, info):
+        # Timeline groups do not keep a last message per copy, it depends on what is visible to the copy
+        loaders = get_loaders(info)
+        if loaders.load_related(loaders.load_related(self, 'member'), 'user_group').is_timeline:
+            return self.visible_group_messages().first()
+        return loaders.load_related(self, 'last_message')
+
+class ChatMessageTimelineConnection(graphene.relay.Connection):
+    class Meta:
+        node = ChatMessageType
+
+class GroupMessageTimelineConnection(graphene.relay.Connection):
+    class Meta:
+        node = GroupMessageType
+
+class DeletionType(graphene.ObjectType):
+    """A row that was deleted"""
+    id = graphene.ID(description="The global id of the deleted row")
+    type_name = graphene.String()
+    deleted_at = graphene.DateTime()
+
+    def resolve_id(self, info):
+        return graphene.relay.Node.to_global_id(self.type_name, self.object_id)
+
+class ChangesType(graphene.ObjectType):
+    """The rows of the current user that changed since a cursor"""
+    cursor = graphene.String(description="The cursor to pass to the next changesSince query")
+    resync_required = graphene.Boolean(description="Whether the changes are too many or too old to be listed, the client has to query everything again")
+    chats = graphene.List(ChatType)
+    groups = graphene.List(UserGroupMemberCopyType)
+    chat_messages = graphene.List(ChatMessageType)
+    group_messages = graphene.List(GroupMessageType)
+    notifications = graphene.List(NotificationType)
+    deletions = graphene.List(DeletionType)
 
 class SubsctiptionType(graphene.ObjectType):
     """The subscription type"""
@@ -0,0 +1,156 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+from django.dispatch import receiver
+from ..models import CustomUser
+
+# The password hash is never cached, a cached user loads it from the database on first access
+USER_FIELDS = [field.attname for field in CustomUser._meta.concrete_fields if field.attname != 'password']
+UPDATED_AT = USER_FIELDS.index('updated_at')
+
+def user_key(pk):
+    return f'user:{pk}'
+
+def username_key(username):
+    return f'user_username:{username}'
+
+def version_key(pk):
+    return f'user_version:{pk}'
+
+def build_user(values):
+    return CustomUser.from_db(CustomUser.objects.db, USER_FIELDS, values)
+
+def is_newer(values, current):
+    """Entries are versioned by updated_at, an older copy of a user never replaces a newer one"""
+    if not isinstance(values, tuple) or not isinstance(current, tuple):
+        return True
+    return current[UPDATED_AT] <= values[UPDATED_AT]
+
+class UserCache:
+    """Two tier cache of the users. An in-process LRU, whose entries live for local_ttl seconds, is in front of the shared cache.
+    Users are cached by primary key, and usernames are cached to their primary key"""
+    def __init__(self, max_size, local_ttl, timeout):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def set_local(self, key, value):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or is_newer(value, entry[1]):
+                self.entries[key] = (time.monotonic() + self.local_ttl, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def lookup(self, key):
+        value = self.get_local(key)
+        if value is None:
+            value = cache.get(key)
+            if value is not None:
+                self.set_local(key, value)
+        return value
+
+    def store(self, values):
+        pk, username = values[USER_FIELDS.index('id')], values[USER_FIELDS.index('username')]
+        cached = cache.get_many([user_key(pk), version_key(pk)])
+        # A row read before the last invalidation is older than its version, and is not cached
+        version = cached.get(version_key(pk))
+        if version is not None and values[UPDATED_AT] < version:
+            return
+        if is_newer(values, cached.get(user_key(pk))):
+            cache.set_many({user_key(pk): values, username_key(username): pk}, timeout=self.timeout)
+        self.set_local(user_key(pk), values)
+        self.set_local(username_key(username), pk)
+
+    def load(self, **lookup):
+        values = CustomUser.objects.filter(**lookup).values_list(*USER_FIELDS).first()
+        if values is not None:
+            self.store(values)
+        return values
+
+    def get(self, pk):
+        """Returns the user with the primary key, or None"""
+        values = self.lookup(user_key(pk)) or self.load(pk=pk)
+        return build_user(values) if values is not None else None
+
+    def get_local_user(self, pk):
+        """Returns the user from the in-process tier only, so it never blocks"""
+        values = self.get_local(user_key(pk))
+        return build_user(values) if values is not None else None
+
+    def get_by_username(self, username):
+        pk = self.lookup(username_key(username))
+        if pk is not None:
+            return self.get(pk)
+        values = self.load(username=username)
+        return build_user(values) if values is not None else None
+
+    def invalidate(self, pk, usernames, version):
+        """Drops a user and its usernames, and stores the version the rows cached from now on must have"""
+        keys = [user_key(pk), *(username_key(username) for username in usernames)]
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        cache.delete_many(keys)
+        cache.set(version_key(pk), version, timeout=self.timeout)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'max_size': self.max_size}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+user_cache = UserCache(
+    getattr(settings, 'USER_CACHE_SIZE', 10000),
+    getattr(settings, 'USER_CACHE_LOCAL_TTL', 5),
+    getattr(settings, 'USER_CACHE_TIMEOUT', 300),
+)
+
+def get_user_by_natural_key(username):
+    """JWT_GET_USER_BY_NATURAL_KEY_HANDLER that reads the users through the cache"""
+    return user_cache.get_by_username(username)
+
+@receiver(pre_save, sender=CustomUser)
+def remember_previous_username(instance, update_fields=None, **kwargs):
+    """Keeps the username the user is cached under, in case the save changes it"""
+    if instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        instance.previous_username = None
+    elif getattr(instance, 'loaded_username', None) is not None:
+        instance.previous_username = instance.loaded_username
+    else:
+        instance.previous_username = CustomUser.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+# UpdateUser, ChangePassword and DeleteUser save or delete the user, as does the admin.
+# The entries are dropped at once, and again on commit in case a concurrent request cached the old row meanwhile.
+# A deleted user is never cached again
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user(instance, **kwargs):
+    pk = instance.pk
+    usernames = {instance.username, getattr(instance, 'previous_username', None)} - {None}
+    instance.loaded_username = instance.username
+    version = instance.updated_at if kwargs['signal'] is post_save else timezone.now()
+    user_cache.invalidate(pk, usernames, version)
+    transaction.on_commit(lambda: user_cache.invalidate(pk, usernames, version))
@@ -0,0 +1,43 @@
+from graphql import GraphQLError, ValidationRule
+from graphql.language import FieldNode, FragmentDefinitionNode, FragmentSpreadNode
+
+MAX_QUERY_DEPTH = 20
+# Depths of the recently validated operations, keyed by the query text and the operation name
+_depths = {}
+_DEPTHS_CACHE_SIZE = 1000
+
+def get_depth(selection_set, fragments, visited=frozenset()):
+    """The number of nested fields in a selection set. Fragments are expanded, and do not count as a level themselves"""
+    if selection_set is None:
+        return 0
+    depth = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            depth = max(depth, 1 + get_depth(selection.selection_set, fragments, visited))
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            # Unknown and cyclic fragments are reported by the other validation rules
+            if name in fragments and name not in visited:
+                depth = max(depth, get_depth(fragments[name].selection_set, fragments, visited | {name}))
+        else:
+            depth = max(depth, get_depth(selection.selection_set, fragments, visited))
+    return depth
+
+class QueryDepthRule(ValidationRule):
+    """Rejects the operations that nest more than MAX_QUERY_DEPTH fields. It runs once per document, before any field is resolved"""
+    def enter_operation_definition(self, node, *_args):
+        document = self.context.document
+        key = (document.loc.source.body if document.loc else None, node.name.value if node.name else None)
+        depth = _depths.get(key) if key[0] is not None else None
+        if depth is None:
+            fragments = {
+                definition.name.value: definition for definition in document.definitions
+                if isinstance(definition, FragmentDefinitionNode)
+            }
+            depth = get_depth(node.selection_set, fragments)
+            if key[0] is not None:
+                if len(_depths) >= _DEPTHS_CACHE_SIZE:
+                    _depths.clear()
+                _depths[key] = depth
+        if depth > MAX_QUERY_DEPTH:
+            self.report_error(GraphQLError(f'Query is too deep, max depth is {MAX_QUERY_DEPTH}', node))
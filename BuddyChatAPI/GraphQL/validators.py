@@ -59,7 +59,8 @@ def validate_group_message_member(group_member):
     return True
 
 def validate_group_message_sender(group_member, sender_id):
-    if group_member.member.id != sender_id:
+    # group_member is None when the user is not a member of the group
+    if group_member is None or group_member.member_id != sender_id:
         raise PermissionDenied('You are not allowed to create, modify or unsend this message')
     return True
 
@@ -78,6 +79,12 @@ def validate_unsend_chat_message(chat_message, sender_id):
         raise PermissionDenied('You are not allowed to unsend this message')
     return True
 
+def validate_read_chat_message(chat_message, user):
+    # Only the receiver reads a message, from their own copy of the chat
+    if chat_message.chat.user_id != user.id or chat_message.sender_id == user.id:
+        raise PermissionDenied('You are not allowed to read this message')
+    return True
+
 def validate_chat_user(chat, user):
     if chat.user.id != user.id:
         raise PermissionDenied('You are not allowed to modify or delete this chat')
@@ -88,6 +95,21 @@ def validate_chat_member(chat, member_id):
         raise PermissionDenied('The user is not a member of this chat')
     return True
 
+def validate_chat_message_in_chat(chat_message, chat):
+    if chat_message.chat_id != chat.id:
+        raise ValidationError('The message does not belong to this chat')
+    return True
+
+def validate_group_message_in_copy(group_message, group_copy):
+    if not group_copy.visible_group_messages().filter(pk=group_message.pk).exists():
+        raise ValidationError('The message does not belong to this group')
+    return True
+
+def validate_notification_receiver(notification, user):
+    if notification.receiver_id != user.id:
+        raise PermissionDenied('You are not allowed to modify this notification')
+    return True
+
 def validate_group_title(title):
     if len(title) < 2:
         raise ValidationError('Group title must be at least 2 characters long')
@@ -111,7 +133,7 @@ def validate_group_creator(user_group, creator):
     return True   
     
 def validate_group_copy_member(group_member_copy, member):
-    if not group_member_copy.member.member.id == member.id:
+    if group_member_copy is None or not group_member_copy.member.member_id == member.id:
         raise PermissionDenied('You are not allowed to modify or delete this group')
     return True
 
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from ...GraphQL.fanout import process_fan_out_queue
+
+class Command(BaseCommand):
+    help = 'Runs the worker that creates the queued group message copies and notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the queued fan outs and exit')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=100, help='Maximum fan outs processed per iteration')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_fan_out_queue(options['batch_size'])
+            if options['once']:
+                self.stdout.write(f'Processed {processed} group message fan outs')
+                return
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
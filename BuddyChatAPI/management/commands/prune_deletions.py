@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ...GraphQL.sync import prune_deletions
+
+class Command(BaseCommand):
+    help = 'Deletes the tombstones of deleted rows older than DELETION_RETENTION seconds'
+
+    def handle(self, *args, **options):
+        deleted = prune_deletions()
+        self.stdout.write(f'Deleted {deleted} tombstones')
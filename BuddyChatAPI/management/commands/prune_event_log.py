@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ...GraphQL.subscriptions.event_log import prune_event_log
+
+class Command(BaseCommand):
+    help = 'Deletes the broadcast events older than EVENT_LOG_RETENTION seconds from the event log'
+
+    def handle(self, *args, **options):
+        deleted = prune_event_log()
+        self.stdout.write(f'Deleted {deleted} events')
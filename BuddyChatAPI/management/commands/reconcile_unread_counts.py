@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef
+from ...GraphQL.helpers import unread_chat_messages_count
+from ...models import Chat, UserGroupMemberCopy, sent_after
+
+class Command(BaseCommand):
+    help = 'Recounts the unread messages of every chat and group copy, fixing any drift of the stored unread counts'
+
+    def handle(self, *args, **options):
+        # Every chat is rewritten, so updated_at is kept, otherwise changesSince would report all of them
+        chats = Chat.objects.filter(read_until__isnull=True).update(unread_count=unread_chat_messages_count(), updated_at=F('updated_at'))
+        chats += Chat.objects.filter(read_until__isnull=False).update(
+            unread_count=unread_chat_messages_count(sent_after(OuterRef('read_until'), OuterRef('read_until_message_id'))),
+            updated_at=F('updated_at'),
+        )
+        self.stdout.write(f'Recounted {chats} chats')
+
+        # Group copies may also see the shared timeline of their group, so they are recounted one by one
+        fixed = 0
+        for group_copy in UserGroupMemberCopy.objects.select_related('member__user_group').iterator():
+            unread_count = group_copy.unread_group_messages().count()
+            if unread_count != group_copy.unread_count:
+                UserGroupMemberCopy.objects.filter(pk=group_copy.pk).update(unread_count=unread_count, updated_at=F('updated_at'))
+                fixed += 1
+        self.stdout.write(f'Fixed {fixed} group copies')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from ...GraphQL.persisted_queries import register_persisted_query
+
+class Command(BaseCommand):
+    help = 'Registers the queries of the given files as persisted queries, one query per file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Files containing the exact query text sent by the clients')
+
+    def handle(self, *args, **options):
+        for path in options['files']:
+            with open(path) as file:
+                sha256_hash = register_persisted_query(file.read())
+            self.stdout.write(f'{sha256_hash} {path}')
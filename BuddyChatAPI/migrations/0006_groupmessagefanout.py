@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0005_alter_usergroup_created_by'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usergroupmembercopy',
+            name='last_message',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copy_last_message', to='BuddyChatAPI.groupmessage'),
+        ),
+        migrations.AlterField(
+            model_name='usergroupmembercopy',
+            name='member',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_copies', to='BuddyChatAPI.groupmember'),
+        ),
+        migrations.CreateModel(
+            name='GroupMessageFanOut',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fan_outs', to='BuddyChatAPI.message')),
+                ('user_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fan_outs', to='BuddyChatAPI.usergroup')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0006_groupmessagefanout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmessage',
+            name='user_group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='timeline_messages', to='BuddyChatAPI.usergroup'),
+        ),
+        migrations.AddField(
+            model_name='usergroup',
+            name='is_timeline',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='usergroup',
+            name='last_message',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='group_last_message', to='BuddyChatAPI.groupmessage'),
+        ),
+        migrations.AddField(
+            model_name='usergroupmembercopy',
+            name='cleared_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='user_group_copy',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='group_messages', to='BuddyChatAPI.usergroupmembercopy'),
+        ),
+        migrations.CreateModel(
+            name='GroupMessageTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('group_message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to='BuddyChatAPI.groupmessage')),
+                ('user_group_copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to='BuddyChatAPI.usergroupmembercopy')),
+            ],
+            options={
+                'unique_together': {('user_group_copy', 'group_message')},
+            },
+        ),
+    ]
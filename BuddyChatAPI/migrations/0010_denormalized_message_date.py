@@ -0,0 +1,118 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_message_date_and_sender(apps, schema_editor):
+    Message = apps.get_model('BuddyChatAPI', 'Message')
+    for model_name in ('ChatMessage', 'GroupMessage', 'Notification'):
+        apps.get_model('BuddyChatAPI', model_name).objects.update(
+            date=Subquery(Message.objects.filter(pk=OuterRef('message_id')).values('date')[:1]),
+            sender=Subquery(Message.objects.filter(pk=OuterRef('message_id')).values('sender_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0008_persistedquery'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chat',
+            options={'ordering': ('-last_message__date',)},
+        ),
+        migrations.AlterModelOptions(
+            name='chatmessage',
+            options={'ordering': ('-date',)},
+        ),
+        migrations.AlterModelOptions(
+            name='groupmessage',
+            options={'ordering': ('-date',)},
+        ),
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ('-date',)},
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='date',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='sender',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='date',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='sender',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='date',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='sender',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_message_date_and_sender, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'date', 'message_id'], name='chatmessage_chat_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['user_group_copy', 'date', 'message_id'], name='groupmessage_copy_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['user_group', 'date', 'message_id'], name='groupmessage_group_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['receiver', 'is_read', 'date'], name='notification_feed_idx'),
+        ),
+    ]
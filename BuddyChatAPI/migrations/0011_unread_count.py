@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0010_denormalized_message_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='unread_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usergroupmembercopy',
+            name='unread_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
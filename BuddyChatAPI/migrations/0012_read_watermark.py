@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0011_unread_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='other_read_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='other_read_until_message_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='read_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='read_until_message_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='usergroupmembercopy',
+            name='read_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='usergroupmembercopy',
+            name='read_until_message_id',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def coalesce_notifications(apps, schema_editor):
+    """Points the per message notifications to their chat or group, and keeps the newest one of each receiver and conversation
+    with the count of the unread ones. The notifications of a message no longer in any conversation are marked as read"""
+    Notification = apps.get_model('BuddyChatAPI', 'Notification')
+    ChatMessage = apps.get_model('BuddyChatAPI', 'ChatMessage')
+    GroupMessage = apps.get_model('BuddyChatAPI', 'GroupMessage')
+    Notification.objects.update(
+        chat=Subquery(ChatMessage.objects.filter(message=OuterRef('message_id'), chat__user=OuterRef('receiver_id')).values('chat_id')[:1]),
+        user_group=Subquery(
+            GroupMessage.objects.filter(message=OuterRef('message_id'))
+            .annotate(group_id=Coalesce('user_group_id', 'user_group_copy__member__user_group_id'))
+            .values('group_id')[:1]
+        ),
+    )
+    # A chat message is never a group message, the chat wins if a row got both
+    Notification.objects.filter(chat__isnull=False).update(user_group=None)
+    Notification.objects.filter(chat__isnull=True, user_group__isnull=True).update(is_read=True)
+    for field in ('chat', 'user_group'):
+        duplicates = Notification.objects.filter(**{f'{field}__isnull': False}).values('receiver_id', field).annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+        for duplicate in duplicates.iterator():
+            notifications = list(
+                Notification.objects.filter(receiver_id=duplicate['receiver_id'], **{field: duplicate[field]})
+                .order_by('-date', '-id').values('id', 'count', 'is_read')
+            )
+            unread = sum(notification['count'] for notification in notifications if not notification['is_read'])
+            Notification.objects.filter(pk=notifications[0]['id']).update(count=unread or 1, is_read=not unread)
+            Notification.objects.filter(pk__in=[notification['id'] for notification in notifications[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0012_read_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='chat',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='BuddyChatAPI.chat'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='user_group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='BuddyChatAPI.usergroup'),
+        ),
+        migrations.RunPython(coalesce_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('receiver', 'chat'), name='notification_receiver_chat_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('receiver', 'user_group'), name='notification_receiver_group_unique'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BuddyChatAPI', '0013_coalesced_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(max_length=150)),
+                ('seq', models.BigIntegerField(unique=True)),
+                ('event', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ('seq',),
+                'indexes': [models.Index(fields=['stream', 'seq'], name='eventlog_stream_seq_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 # Create your models here.
 
@@ -11,6 +12,19 @@ class CustomUser(AbstractUser):
     
     class Meta:
         ordering = ('-date_joined',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The username the user is cached under, so a save that renames the user does not read it again
+        instance.loaded_username = instance.__dict__.get('username')
+        return instance
+        
+    def save(self, *args, update_fields=None, **kwargs):
+        # The cached users are versioned by updated_at, so it moves with every save
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+        super().save(*args, update_fields=update_fields, **kwargs)
     
 class PhoneNumber(models.Model):
     number = models.CharField(max_length=15)
@@ -24,7 +38,27 @@ class PhoneNumber(models.Model):
         return f'+{self.country_code} {self.number}'
 
 
-class Message(models.Model):
+class UpdatedAtQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Queryset updates bypass auto_now
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+class TrackedModel(models.Model):
+    """Base of the rows that changesSince reports. updated_at also moves with queryset updates and saves of some fields"""
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    objects = UpdatedAtQuerySet.as_manager()
+    
+    class Meta:
+        abstract = True
+        
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+class Message(TrackedModel):
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     date = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -35,22 +69,71 @@ class Message(models.Model):
         
     def __str__(self):
         return f'A message from {self.sender} at {self.date} - {self.content}'
+
+class MessageCopy(TrackedModel):
+    """Base of the rows that point to a message. They store the date and the sender of the message,
+    so they are sorted and filtered without joining the message"""
+    date = models.DateTimeField()
+    sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        abstract = True
         
-class Chat(models.Model):
+    def save(self, *args, **kwargs):
+        if self.date is None:
+            self.date = self.message.date
+            self.sender_id = self.message.sender_id
+        super().save(*args, **kwargs)
+
+def sent_after(date, message_id):
+    """Matches the message copies that come after the (date, message id) key of a message"""
+    return models.Q(date__gt=date) | models.Q(date=date, message_id__gt=message_id)
+
+def read_up_to(date, message_id, prefix='read_until'):
+    """Matches the chats or group copies whose read watermark already covers the (date, message id) key of a message"""
+    return models.Q(**{f'{prefix}__gt': date}) | models.Q(**{prefix: date, f'{prefix}_message_id__gte': message_id})
+
+def watermark_covers(read_until, read_until_message_id, message_copy):
+    return read_until is not None and (message_copy.date, message_copy.message_id) <= (read_until, read_until_message_id)
+
+class ReadWatermark(models.Model):
+    """Base of the chats and group copies. Every message up to the (date, message id) read watermark is read"""
+    read_until = models.DateTimeField(null=True)
+    read_until_message_id = models.BigIntegerField(null=True)
+    
+    class Meta:
+        abstract = True
+        
+    def has_read(self, message_copy):
+        return message_copy.message.read_at is not None or watermark_covers(self.read_until, self.read_until_message_id, message_copy)
+        
+class Chat(ReadWatermark, TrackedModel):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='chats', db_index=True)
     other_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='other_user_chats', db_index=True, null=True)
     archived = models.BooleanField(default=False, db_index=True)
     last_message = models.ForeignKey('ChatMessage', on_delete=models.SET_NULL, null=True, related_name='last_message')
+    # Kept up to date with F() updates by the message mutations, `manage.py reconcile_unread_counts` fixes any drift
+    unread_count = models.IntegerField(default=0)
+    # The read watermark of the other user's chat, so the read status of sent messages needs no extra query
+    other_read_until = models.DateTimeField(null=True)
+    other_read_until_message_id = models.BigIntegerField(null=True)
     
     def __str__(self):
         return f'Chat between {self.user1} and {self.user2}, Archived: {self.archived}'
     
     class Meta:
         unique_together = ('user', 'other_user')
-        ordering = ('-last_message__message__date',)
+        ordering = ('-last_message__date',)
+        
+    def unread_chat_messages(self):
+        """The messages of the other user that are not read yet"""
+        unread = self.chat_messages.filter(message__read_at__isnull=True).exclude(sender_id=self.user_id)
+        if self.read_until:
+            unread = unread.filter(sent_after(self.read_until, self.read_until_message_id))
+        return unread
     
 
-class ChatMessage(models.Model):
+class ChatMessage(MessageCopy):
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='chat_messages')
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='chat_messages')
     
@@ -58,15 +141,19 @@ class ChatMessage(models.Model):
         return f'{self.chat} - {self.message}'
     
     class Meta:
-        ordering = ('-message__date',)
+        ordering = ('-date',)
+        # Message timelines seek by (date, message id) within a chat
+        indexes = [models.Index(fields=['chat', 'date', 'message_id'], name='chatmessage_chat_keyset_idx')]
     
-class UserGroup(models.Model):
+class UserGroup(TrackedModel):
     title = models.CharField(max_length=100, db_index=True)
     description = models.TextField(default='')
     members_count = models.IntegerField(default=0)
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, related_name='created_groups', null=True)
     group_image = models.ImageField(upload_to='group_images', default='group_images/default.svg')
-    updated_at = models.DateTimeField(auto_now=True)
+    # Large groups store their messages once in a shared timeline instead of once per member copy
+    is_timeline = models.BooleanField(default=False)
+    last_message = models.ForeignKey('GroupMessage', on_delete=models.SET_NULL, null=True, related_name='group_last_message')
         
     def __str__(self):
         return self.title
@@ -81,25 +168,77 @@ class GroupMember(models.Model):
         unique_together = ('user_group', 'member')
         ordering = ('joined_at',)
 
-class UserGroupMemberCopy(models.Model):
+class UserGroupMemberCopy(ReadWatermark, TrackedModel):
     member = models.ForeignKey(GroupMember, on_delete=models.CASCADE, related_name='group_copies')
     is_archived = models.BooleanField(default=False)
     last_message = models.ForeignKey('GroupMessage', on_delete=models.SET_NULL, null=True, related_name='copy_last_message')
+    # Timeline messages sent before this date are hidden for this copy
+    cleared_at = models.DateTimeField(null=True)
+    unread_count = models.IntegerField(default=0)
+    
+    def visible_group_messages(self):
+        """The group messages of this copy merged with the messages of the shared group timeline that are visible to it"""
+        visible = models.Q(user_group_copy=self)
+        user_group = self.member.user_group
+        if user_group.is_timeline:
+            timeline = models.Q(user_group=user_group, date__gte=self.member.joined_at)
+            if self.cleared_at:
+                timeline &= models.Q(date__gt=self.cleared_at)
+            visible |= timeline
+        return GroupMessage.objects.filter(visible).exclude(tombstones__user_group_copy=self)
+        
+    def unread_group_messages(self):
+        """The visible messages of the other members that are not read yet"""
+        unread = self.visible_group_messages().filter(message__read_at__isnull=True).exclude(sender_id=self.member.member_id)
+        if self.read_until:
+            unread = unread.filter(sent_after(self.read_until, self.read_until_message_id))
+        return unread
     
-class GroupMessage(models.Model):
+class GroupMessage(MessageCopy):
+    """A group message either belongs to a member copy, or to the shared timeline of its group when user_group is set"""
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='group_messages')
-    user_group_copy = models.ForeignKey(UserGroupMemberCopy, on_delete=models.CASCADE, related_name='group_messages', default=None)
+    user_group_copy = models.ForeignKey(UserGroupMemberCopy, on_delete=models.CASCADE, related_name='group_messages', default=None, null=True)
+    user_group = models.ForeignKey(UserGroup, on_delete=models.CASCADE, related_name='timeline_messages', null=True)
+    
+    def get_user_group(self):
+        if self.user_group_id:
+            return self.user_group
+        return self.user_group_copy.member.user_group
     
     class Meta:
-        ordering = ('-message__date',)
+        ordering = ('-date',)
+        indexes = [
+            models.Index(fields=['user_group_copy', 'date', 'message_id'], name='groupmessage_copy_keyset_idx'),
+            models.Index(fields=['user_group', 'date', 'message_id'], name='groupmessage_group_keyset_idx'),
+        ]
     
-class Notification(models.Model):
+class GroupMessageTombstone(models.Model):
+    """Hides a timeline group message for one member copy"""
+    user_group_copy = models.ForeignKey(UserGroupMemberCopy, on_delete=models.CASCADE, related_name='tombstones')
+    group_message = models.ForeignKey(GroupMessage, on_delete=models.CASCADE, related_name='tombstones')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('user_group_copy', 'group_message')
+    
+class Notification(MessageCopy):
+    """The live notification of a receiver for a chat or a group. The new messages of the conversation update it instead of adding notifications,
+    and count is the number of messages since it was read"""
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='notifications')
     receiver = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='notifications', null=True)
+    user_group = models.ForeignKey(UserGroup, on_delete=models.CASCADE, related_name='notifications', null=True)
+    count = models.IntegerField(default=1)
     is_read = models.BooleanField(default=False)
     
     class Meta:
-        ordering = ('-message__date',)
+        ordering = ('-date',)
+        indexes = [models.Index(fields=['receiver', 'is_read', 'date'], name='notification_feed_idx')]
+        # NULLs are distinct in unique indexes, so each constraint only applies to the notifications of its conversation kind
+        constraints = [
+            models.UniqueConstraint(fields=['receiver', 'chat'], name='notification_receiver_chat_unique'),
+            models.UniqueConstraint(fields=['receiver', 'user_group'], name='notification_receiver_group_unique'),
+        ]
         
 class Attachment(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='attachments')
@@ -107,3 +246,52 @@ class Attachment(models.Model):
     
     class Meta:
         ordering = ('-message__date',)
+
+class GroupMessageFanOut(models.Model):
+    """A durable queue entry for a group message whose member copies and notifications are still to be created"""
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='fan_outs')
+    user_group = models.ForeignKey(UserGroup, on_delete=models.CASCADE, related_name='fan_outs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    
+    class Meta:
+        ordering = ('id',)
+
+class PersistedQuery(models.Model):
+    """A query registered under the SHA-256 hash of its text, so clients can send the hash instead of the query"""
+    sha256_hash = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class EventLog(models.Model):
+    """A broadcast event of a channel layer group, kept so a client that reconnects can replay what it missed.
+    seq is stamped on the event as it is sent, and increases across all the groups"""
+    stream = models.CharField(max_length=150)
+    seq = models.BigIntegerField(unique=True)
+    event = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ('seq',)
+        indexes = [models.Index(fields=['stream', 'seq'], name='eventlog_stream_seq_idx')]
+
+class EventSequence(models.Model):
+    """The last sequence number of the event log, in a single row. Its row lock orders the logged batches"""
+    last = models.BigIntegerField(default=0)
+
+class Deletion(models.Model):
+    """A tombstone of a deleted row, so changesSince reports the deletion. It is reported to the user,
+    or to every member of user_group for the rows shared by the group"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+', null=True)
+    user_group = models.ForeignKey(UserGroup, on_delete=models.CASCADE, related_name='+', null=True)
+    type_name = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ('deleted_at',)
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='deletion_user_idx'),
+            models.Index(fields=['user_group', 'deleted_at'], name='deletion_group_idx'),
+        ]
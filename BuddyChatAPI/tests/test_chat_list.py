@@ -0,0 +1,92 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from django.core.cache import cache
+from graphene.relay import Node
+from graphql_jwt.shortcuts import get_token
+from ..models import Chat, CustomUser
+
+class ChatListTestCase(GraphQLTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='user', email='user@gg.com')
+        self.others = [CustomUser.objects.create(username=f'other{i}', email=f'other{i}@gg.com') for i in range(3)]
+        self.chats = [Chat.objects.create(user=self.user, other_user=other) for other in self.others]
+        for other in self.others:
+            Chat.objects.create(user=other, other_user=self.user)
+        self.headers = {'Authorization': f'JWT {get_token(self.user)}'}
+
+    def chat_page(self, **variables):
+        response = self.query('''
+            query Chats($first: Int = 20, $after: String, $archived: Boolean) {
+                chats(first: $first, after: $after, archived: $archived) {
+                    edges {
+                        node {
+                            id
+                        }
+                    }
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                }
+            }
+        ''', variables=variables, headers=self.headers)
+        self.assertResponseNoErrors(response)
+        return response.json()['data']['chats']
+
+    def chat_ids(self, **variables):
+        return [edge['node']['id'] for edge in self.chat_page(**variables)['edges']]
+
+    def test_chat_list_is_cached_and_invalidated(self):
+        expected = [Node.to_global_id('ChatType', chat.id) for chat in reversed(self.chats)]
+        self.assertEqual(self.chat_ids(), expected)
+        # The cached list is used until an event changes it
+        Chat.objects.bulk_create([Chat(user=self.user, other_user=self.user)])
+        self.assertEqual(self.chat_ids(), expected)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.query('''
+                mutation CreateChatMessage($chatId: ID!, $content: String!) {
+                    createChatMessage(chatId: $chatId, content: $content) {
+                        chatMessage {
+                            id
+                        }
+                    }
+                }
+            ''', variables={'chatId': Node.to_global_id('ChatType', self.chats[0].id), 'content': 'Hello'}, headers=self.headers)
+            self.assertResponseNoErrors(response)
+            # The list is invalidated once the message is committed
+            self.assertEqual(len(self.chat_ids()), 3)
+        chat_ids = self.chat_ids()
+        self.assertEqual(len(chat_ids), 4)
+        self.assertEqual(chat_ids[0], Node.to_global_id('ChatType', self.chats[0].id))
+
+    def test_chat_list_pages(self):
+        expected = [Node.to_global_id('ChatType', chat.id) for chat in reversed(self.chats)]
+        first_page = self.chat_page(first=2)
+        self.assertEqual([edge['node']['id'] for edge in first_page['edges']], expected[:2])
+        self.assertTrue(first_page['pageInfo']['hasNextPage'])
+        second_page = self.chat_page(first=2, after=first_page['pageInfo']['endCursor'])
+        self.assertEqual([edge['node']['id'] for edge in second_page['edges']], expected[2:])
+        self.assertFalse(second_page['pageInfo']['hasNextPage'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chats[1].archived = True
+            self.chats[1].save(update_fields=['archived'])
+        self.assertEqual(self.chat_ids(first=1, archived=True), [expected[1]])
+        self.assertEqual(self.chat_ids(first=2, archived=False), [expected[0], expected[2]])
+
+    def test_self_chat_message_moves_the_chat(self):
+        self_chat = Chat.objects.create(user=self.user, other_user=self.user)
+        for chat in (self.chats[0], self_chat):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.query('''
+                    mutation CreateChatMessage($chatId: ID!, $content: String!) {
+                        createChatMessage(chatId: $chatId, content: $content) {
+                            chatMessage {
+                                id
+                            }
+                        }
+                    }
+                ''', variables={'chatId': Node.to_global_id('ChatType', chat.id), 'content': 'Hello'}, headers=self.headers)
+                self.assertResponseNoErrors(response)
+            self.assertEqual(self.chat_ids()[0], Node.to_global_id('ChatType', chat.id))
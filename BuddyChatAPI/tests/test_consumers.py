@@ -0,0 +1,194 @@
+import json
+import msgpack
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from ..models import CustomUser, EventLog, EventSequence
+from ..GraphQL.subscriptions.outbox import publish
+from ..GraphQL.subscriptions.consumers import RESYNC_REQUIRED, MainConsumer, Subscription
+from ..GraphQL.subscriptions.encoding import COMPACT_SUBPROTOCOL
+
+SUBSCRIPTION = 'subscription { subscribe { success } }'
+
+class MainConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='socket', email='socket@gg.com')
+
+    async def connect(self, subprotocol='graphql-transport-ws'):
+        async def get_user():
+            return self.user
+        communicator = WebsocketCommunicator(MainConsumer.as_asgi(), '/graphql', subprotocols=[subprotocol])
+        communicator.scope['user'] = get_user()
+        connected, accepted = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(accepted, subprotocol)
+        if subprotocol == COMPACT_SUBPROTOCOL:
+            return communicator
+        await communicator.send_json_to({'type': 'connection_init'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connection_ack')
+        return communicator
+
+    async def subscribe(self, communicator, subscription_id, query=SUBSCRIPTION, extensions=None):
+        await communicator.send_json_to({'type': 'subscribe', 'id': subscription_id, 'payload': {'query': query, 'extensions': extensions}})
+        return await communicator.receive_json_from()
+
+    def test_subscriptions_are_multiplexed(self):
+        async def run():
+            communicator = await self.connect()
+            self.assertEqual((await self.subscribe(communicator, 'first'))['id'], 'first')
+            self.assertEqual((await self.subscribe(communicator, 'second'))['id'], 'second')
+            # Each subscription receives the broadcasts of the user
+            await communicator.send_json_to({'type': 'ping'})
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'pong'})
+            await get_channel_layer().group_send('user_socket', {'type': 'broadcast', 'operation': 'TEST'})
+            received = {(await communicator.receive_json_from())['id'] for _ in range(2)}
+            self.assertEqual(received, {'first', 'second'})
+
+            # A completed subscription stops receiving
+            await communicator.send_json_to({'type': 'complete', 'id': 'first'})
+            await communicator.send_json_to({'type': 'ping'})
+            await communicator.receive_json_from()
+            await get_channel_layer().group_send('user_socket', {'type': 'broadcast', 'operation': 'TEST'})
+            self.assertEqual((await communicator.receive_json_from())['id'], 'second')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_subscription_filters(self):
+        async def run():
+            communicator = await self.connect()
+            await self.subscribe(communicator, 'chat', 'subscription { subscribe(chatIds: ["chat-1"], operations: ["CHAT_MESSAGE_CREATED"]) { success } }')
+            channel_layer = get_channel_layer()
+            for operation, chat_id in (('CHAT_MESSAGE_CREATED', 'chat-2'), ('CHAT_MESSAGE_UPDATED', 'chat-1'), ('NOTIFICATION_CREATED', None), ('CHAT_MESSAGE_CREATED', 'chat-1')):
+                await channel_layer.group_send('user_socket', {'type': 'broadcast', 'operation': operation, 'chatMessage': {'chat': {'id': chat_id}}})
+            response = await communicator.receive_json_from()
+            self.assertEqual((response['payload']['operation'], response['payload']['chatMessage']['chat']['id']), ('CHAT_MESSAGE_CREATED', 'chat-1'))
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    @override_settings(NOTIFICATION_BROADCAST_INTERVAL=0.2)
+    def test_notification_broadcasts_are_throttled(self):
+        async def run():
+            communicator = await self.connect()
+            await self.subscribe(communicator, 'notifications')
+            channel_layer = get_channel_layer()
+            for notification_id, count in (('first', 1), ('first', 2), ('second', 1), ('first', 3)):
+                await channel_layer.group_send('user_socket', {'type': 'broadcast', 'operation': 'NOTIFICATION_CREATED', 'notification': {'id': notification_id, 'count': count}})
+            notification = (await communicator.receive_json_from())['payload']['notification']
+            self.assertEqual(notification, {'id': 'first', 'count': 1})
+            self.assertTrue(await communicator.receive_nothing(0.1))
+            # The latest change of each notification held back is sent when the interval ends
+            received = [(await communicator.receive_json_from(1))['payload']['notification'] for _ in range(2)]
+            self.assertEqual(received, [{'id': 'first', 'count': 3}, {'id': 'second', 'count': 1}])
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_missed_events_are_replayed(self):
+        for operation in ('FIRST', 'SECOND', 'THIRD'):
+            publish('user_socket', {'type': 'broadcast', 'operation': operation})
+        first, second, third = EventLog.objects.values_list('seq', flat=True)
+        self.assertEqual((second, third), (first + 1, first + 2))
+
+        async def run():
+            communicator = await self.connect()
+            await self.subscribe(communicator, 'resumed', extensions={'resumeFrom': first})
+            replayed = [await communicator.receive_json_from() for _ in range(2)]
+            self.assertEqual([(event['payload']['operation'], event['payload']['seq']) for event in replayed], [('SECOND', second), ('THIRD', third)])
+
+            # The events before the oldest logged one were pruned, so they cannot be replayed
+            await database_sync_to_async(EventLog.objects.filter(seq=first).delete)()
+            await self.subscribe(communicator, 'stale', extensions={'resumeFrom': first - 1})
+            self.assertEqual((await communicator.receive_json_from())['payload']['operation'], 'RESYNC_REQUIRED')
+
+            response = await self.subscribe(communicator, 'invalid', extensions={'resumeFrom': 'latest'})
+            self.assertEqual((response['type'], response['payload'][0]['message']), ('error', 'resumeFrom must be a sequence number'))
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+        # The sequence continues from the log when its row is missing
+        EventSequence.objects.all().delete()
+        publish('user_socket', {'type': 'broadcast', 'operation': 'FOURTH'})
+        self.assertEqual(EventLog.objects.last().seq, third + 1)
+
+    def test_compact_subprotocol_sends_msgpack_frames_with_a_key_dictionary(self):
+        keys = []
+
+        async def receive_compact(communicator):
+            frame = await communicator.receive_from()
+            new_keys, message = msgpack.unpackb(frame, strict_map_key=False)
+            keys.extend(new_keys)
+
+            def expand(value):
+                if isinstance(value, dict):
+                    return {keys[index]: expand(item) for index, item in value.items()}
+                if isinstance(value, list):
+                    return [expand(item) for item in value]
+                return value
+            return new_keys, expand(message), frame
+
+        async def run():
+            communicator = await self.connect(COMPACT_SUBPROTOCOL)
+            await communicator.send_to(bytes_data=msgpack.packb({'type': 'connection_init'}))
+            self.assertEqual((await receive_compact(communicator))[1], {'type': 'connection_ack'})
+            await communicator.send_to(bytes_data=msgpack.packb({'type': 'subscribe', 'id': 'compact', 'payload': {'query': SUBSCRIPTION}}))
+            self.assertEqual((await receive_compact(communicator))[1]['payload'], {'subscribe': {'success': True}})
+
+            event = {'type': 'broadcast', 'operation': 'CHAT_MESSAGE_CREATED', 'chatMessage': {'id': 'message-1', 'chat': {'id': 'chat-1'}}}
+            for _ in range(2):
+                await get_channel_layer().group_send('user_socket', event)
+            new_keys, message, _ = await receive_compact(communicator)
+            self.assertEqual(new_keys, ['operation', 'chatMessage', 'chat'])
+            self.assertEqual(message['payload'], event)
+            # The keys are sent once per connection
+            new_keys, message, frame = await receive_compact(communicator)
+            self.assertEqual((new_keys, message['payload']), ([], event))
+            self.assertLess(len(frame), len(json.dumps(message)) / 2)
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_invalid_subscription_sends_an_error(self):
+        async def run():
+            communicator = await self.connect()
+            await communicator.send_json_to({'type': 'subscribe', 'id': 'invalid', 'payload': {'query': 'subscription { missing }'}})
+            response = await communicator.receive_json_from()
+            self.assertEqual((response['type'], response['id']), ('error', 'invalid'))
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_failed_subscription_sends_an_error(self):
+        async def run():
+            communicator = await self.connect()
+            with mock.patch('BuddyChatAPI.GraphQL.subscriptions.consumers.resolve_persisted_query', side_effect=RuntimeError), self.assertLogs('BuddyChatAPI.GraphQL.subscriptions.consumers'):
+                response = await self.subscribe(communicator, 'failed')
+            self.assertEqual((response['type'], response['id'], response['payload']), ('error', 'failed', [{'message': 'Internal server error'}]))
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    @override_settings(SUBSCRIPTION_QUEUE_SIZE=2)
+    def test_overflowing_subscription_is_asked_to_resync(self):
+        subscription = Subscription()
+        for operation in ('FIRST', 'SECOND', 'THIRD', 'FOURTH'):
+            subscription.put({'type': 'broadcast', 'operation': operation})
+        # The broadcasts that did not fit are dropped, the ones after the resync are kept
+        self.assertEqual([subscription.queue.get_nowait() for _ in range(2)], [RESYNC_REQUIRED, {'type': 'broadcast', 'operation': 'FOURTH'}])
+
+    def test_group_message_copies_are_sent_with_the_id_of_the_own_copy(self):
+        consumer = MainConsumer()
+        consumer.group_copies = {1: 7}
+        event = {
+            'type': 'group_broadcast',
+            'group_id': 1,
+            'operation': 'GROUP_MESSAGE_UPDATED',
+            'group_message_ids': {'7': 'own', '8': 'other'},
+            'groupMessage': {'message': None, 'groupCopy': {}},
+        }
+        payload = consumer.get_group_payload(event)
+        self.assertEqual(payload['groupMessage']['id'], 'own')
+        self.assertNotIn('group_message_ids', payload)
+        # A member whose copy is still queued by the fan out is not sent the update
+        consumer.group_copies = {1: 9}
+        self.assertIsNone(consumer.get_group_payload(event))
@@ -0,0 +1,52 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from django.core.cache import cache
+from django.test import override_settings
+from graphql_jwt.shortcuts import get_token
+from ..models import CustomUser
+
+class QueryCostTestCase(GraphQLTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='test', email='test@gg.com')
+        self.headers = {'Authorization': f'JWT {get_token(self.user)}'}
+        self.chats_query = '''
+            query Chats($first: Int) {
+                chats(first: $first) {
+                    edges {
+                        node {
+                            archived
+                            chatMessages(first: 20) {
+                                edges {
+                                    node {
+                                        id
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        '''
+
+    def test_cost_is_multiplied_through_connections(self):
+        response = self.query(self.chats_query, variables={'first': 2}, headers=self.headers)
+        self.assertResponseNoErrors(response)
+        # chats: 1 + 2 * (edges: 1 + node: 1 + chatMessages: 1 + 20 * (edges: 1 + node: 1))
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 1 + 2 * (2 + 1 + 20 * 2))
+
+    @override_settings(GRAPHQL_MAX_QUERY_COST=100)
+    def test_expensive_query_is_rejected(self):
+        response = self.query(self.chats_query, variables={'first': 10}, headers=self.headers)
+        self.assertResponseHasErrors(response)
+        self.assertIn('Query is too expensive', response.json()['errors'][0]['message'])
+
+    @override_settings(GRAPHQL_COST_BUDGET=200)
+    def test_cost_budget_is_charged_per_user(self):
+        response = self.query(self.chats_query, variables={'first': 2}, headers=self.headers)
+        self.assertResponseNoErrors(response)
+        self.assertEqual(response.json()['extensions']['cost']['remaining'], 200 - 87)
+        self.assertResponseNoErrors(self.query(self.chats_query, variables={'first': 2}, headers=self.headers))
+        response = self.query(self.chats_query, variables={'first': 2}, headers=self.headers)
+        self.assertIn('Query cost budget exceeded', response.json()['errors'][0]['message'])
+        # Anonymous requests are charged to their own budget
+        self.assertResponseNoErrors(self.query('query { users(first: 1) { edges { node { username } } } }'))
@@ -0,0 +1,152 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from io import StringIO
+from unittest import mock
+from django.db import connection
+from django.db.models import F
+from django.core.management import call_command
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+from ..models import UserGroup, CustomUser, GroupMember, GroupMessage, GroupMessageFanOut, Notification, UserGroupMemberCopy
+from graphene.relay.node import Node
+
+class GroupFanOutTestCase(GraphQLTestCase):
+    def setUp(self):
+        self.create_group_message_mutation = '''
+            mutation CreateGroupMessage($groupCopyId: ID!, $content: String!) {
+                createGroupMessage(groupCopyId: $groupCopyId, content: $content) {
+                    groupMessage {
+                        id
+                    }
+                }
+            }
+        '''
+
+    def create_group(self, title, members_count):
+        """Creates a group with the given number of members, the first member is the sender"""
+        CustomUser.objects.bulk_create([CustomUser(username=f'{title}_{i}', email=f'{title}_{i}@gg.com') for i in range(members_count)])
+        users = list(CustomUser.objects.filter(username__startswith=f'{title}_').order_by('id'))
+        user_group = UserGroup.objects.create(title=title, created_by=users[0], members_count=members_count)
+        GroupMember.objects.bulk_create([GroupMember(user_group=user_group, member=user) for user in users])
+        members = list(GroupMember.objects.filter(user_group=user_group).order_by('member_id'))
+        UserGroupMemberCopy.objects.bulk_create([UserGroupMemberCopy(member=member) for member in members])
+        sender_copy = UserGroupMemberCopy.objects.get(member=members[0])
+        return users[0], sender_copy
+
+    def count_message_queries(self, sender, sender_copy):
+        token = get_token(sender)
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(
+                query=self.create_group_message_mutation,
+                variables={'groupCopyId': Node.to_global_id('UserGroupMemberCopyType', sender_copy.id), 'content': 'Hello group'},
+                headers={'Authorization': f'JWT {token}'}
+            )
+        self.assertResponseNoErrors(response)
+        return len(context.captured_queries)
+
+    def test_fan_out_writes_every_member(self):
+        sender, sender_copy = self.create_group('small', 5)
+        self.count_message_queries(sender, sender_copy)
+        self.assertEqual(GroupMessage.objects.count(), 5)
+        self.assertEqual(Notification.objects.count(), 4)
+        # The bulk created rows carry the date and the sender of the message
+        self.assertFalse(GroupMessage.objects.exclude(date=F('message__date'), sender=F('message__sender')).exists())
+        self.assertFalse(Notification.objects.exclude(date=F('message__date'), sender=F('message__sender')).exists())
+        # Every group copy points to its own copy of the message
+        for member_copy in UserGroupMemberCopy.objects.all():
+            self.assertIsNotNone(member_copy.last_message)
+            self.assertEqual(member_copy.last_message.user_group_copy_id, member_copy.id)
+
+    def test_fan_out_query_count_does_not_depend_on_group_size(self):
+        small_sender, small_copy = self.create_group('small', 5)
+        large_sender, large_copy = self.create_group('large', 100)
+        small_queries = self.count_message_queries(small_sender, small_copy)
+        large_queries = self.count_message_queries(large_sender, large_copy)
+        self.assertEqual(small_queries, large_queries)
+
+    @override_settings(GROUP_MESSAGE_FAN_OUT='queued')
+    def test_queued_fan_out(self):
+        sender, sender_copy = self.create_group('queued', 5)
+        self.count_message_queries(sender, sender_copy)
+        # Only the sender's group message is created in the request
+        self.assertEqual(GroupMessage.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(GroupMessageFanOut.objects.count(), 1)
+        
+        call_command('process_group_fan_out', '--once', stdout=StringIO())
+        self.assertEqual(GroupMessage.objects.count(), 5)
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertEqual(GroupMessageFanOut.objects.count(), 0)
+        for member_copy in UserGroupMemberCopy.objects.all():
+            self.assertEqual(member_copy.last_message.user_group_copy_id, member_copy.id)
+
+    def test_updated_copies_are_broadcast_once(self):
+        sender, sender_copy = self.create_group('edited', 3)
+        headers = {'Authorization': f'JWT {get_token(sender)}'}
+        response = self.query(
+            query=self.create_group_message_mutation,
+            variables={'groupCopyId': Node.to_global_id('UserGroupMemberCopyType', sender_copy.id), 'content': 'Hello group'},
+            headers=headers
+        )
+        self.assertResponseNoErrors(response)
+        with mock.patch('BuddyChatAPI.GraphQL.subscriptions.signals.publish') as publish:
+            response = self.query('''
+                mutation UpdateGroupMessage($groupMessageId: ID!, $content: String!) {
+                    updateGroupMessage(groupMessageId: $groupMessageId, content: $content) {
+                        groupMessage {
+                            id
+                        }
+                    }
+                }
+            ''', variables={'groupMessageId': response.json()['data']['createGroupMessage']['groupMessage']['id'], 'content': 'Edited'}, headers=headers)
+        self.assertResponseNoErrors(response)
+        publish.assert_called_once()
+        group, event = publish.call_args[0]
+        self.assertEqual(group, f'group_{sender_copy.member.user_group_id}')
+        group_messages = GroupMessage.objects.filter(user_group_copy__member__user_group_id=sender_copy.member.user_group_id)
+        self.assertEqual(event['group_message_ids'], {
+            str(group_message.user_group_copy_id): Node.to_global_id('GroupMessageType', group_message.id) for group_message in group_messages
+        })
+        self.assertEqual(len(event['group_message_ids']), 3)
+
+    @override_settings(GROUP_MESSAGE_FAN_OUT='queued')
+    def test_queued_message_can_be_updated_and_unsent(self):
+        sender, sender_copy = self.create_group('pending', 3)
+        headers = {'Authorization': f'JWT {get_token(sender)}'}
+        response = self.query(
+            query=self.create_group_message_mutation,
+            variables={'groupCopyId': Node.to_global_id('UserGroupMemberCopyType', sender_copy.id), 'content': 'Hello group'},
+            headers=headers
+        )
+        self.assertResponseNoErrors(response)
+        group_message_id = response.json()['data']['createGroupMessage']['groupMessage']['id']
+
+        # The other members have no copy yet, the worker has not run
+        response = self.query('''
+            mutation UpdateGroupMessage($groupMessageId: ID!, $content: String!) {
+                updateGroupMessage(groupMessageId: $groupMessageId, content: $content) {
+                    groupMessage {
+                        message {
+                            content
+                        }
+                    }
+                }
+            }
+        ''', variables={'groupMessageId': group_message_id, 'content': 'Edited'}, headers=headers)
+        self.assertResponseNoErrors(response)
+        self.assertEqual(response.json()['data']['updateGroupMessage']['groupMessage']['message']['content'], 'Edited')
+
+        response = self.query('''
+            mutation UnsendGroupMessage($groupMessageId: ID!) {
+                unsendGroupMessage(groupMessageId: $groupMessageId) {
+                    success
+                }
+            }
+        ''', variables={'groupMessageId': group_message_id}, headers=headers)
+        self.assertResponseNoErrors(response)
+        # The pending fan out is dropped with the message, so the worker copies nothing afterwards
+        self.assertEqual(GroupMessageFanOut.objects.count(), 0)
+        call_command('process_group_fan_out', '--once', stdout=StringIO())
+        self.assertEqual(GroupMessage.objects.count(), 0)
+        sender_copy.refresh_from_db()
+        self.assertIsNone(sender_copy.last_message)
@@ -1,4 +1,5 @@
 from graphene_django.utils.testing import GraphQLTestCase
+from django.test import override_settings
 from ..models import UserGroup, CustomUser, GroupMember, GroupMessage, Message, UserGroupMemberCopy
 from ..GraphQL.helpers import create_message
 from graphene.relay.node import Node
@@ -563,3 +564,90 @@ class GroupTestCase(GraphQLTestCase):
         content = response.json()
         self.assertResponseNoErrors(response)
         self.assertEqual(content['data']['setArchiveGroup']['groupCopy']['isArchived'], True)
+        
+    @override_settings(GROUP_TIMELINE_THRESHOLD=4)
+    def test_timeline_group_message(self):
+        groupCopyId = Node.to_global_id('UserGroupMemberCopyType', self.group_member_copy1.id)
+        response = self.query(
+            query=self.create_group_message_mutation,
+            variables={'groupCopyId': groupCopyId, 'content': 'Hello timeline'},
+            headers={'Authorization': f'JWT {self.user1_token}'}
+        )
+        self.assertResponseNoErrors(response)
+        # The message is stored once in the group timeline
+        self.group_messages_count += 1
+        self.assertEqual(GroupMessage.objects.count(), self.group_messages_count)
+        self.group.refresh_from_db()
+        self.assertTrue(self.group.is_timeline)
+        group_message_id = response.json()['data']['createGroupMessage']['groupMessage']['id']
+        
+        group_messages_query = '''
+            query group($id: ID!) {
+                group(id: $id) {
+                    lastMessage {
+                        id
+                    }
+                    groupMessages {
+                        edges {
+                            node {
+                                id
+                            }
+                        }
+                    }
+                }
+            }
+        '''
+        group_copy2_id = Node.to_global_id('UserGroupMemberCopyType', self.group_member_copy2.id)
+        response = self.query(query=group_messages_query, variables={'id': group_copy2_id}, headers={'Authorization': f'JWT {self.user2_token}'})
+        self.assertResponseNoErrors(response)
+        content = response.json()
+        self.assertEqual(content['data']['group']['lastMessage']['id'], group_message_id)
+        self.assertIn(group_message_id, [edge['node']['id'] for edge in content['data']['group']['groupMessages']['edges']])
+        
+        # Deleting the message only hides it for the current user
+        response = self.query(
+            '''
+            mutation DeleteGroupMessage($groupMessageId: ID!) {
+                deleteGroupMessage(groupMessageId: $groupMessageId) {
+                    success
+                }
+            }
+            ''',
+            variables={'groupMessageId': group_message_id},
+            headers={'Authorization': f'JWT {self.user2_token}'}
+        )
+        self.assertResponseNoErrors(response)
+        self.assertEqual(GroupMessage.objects.count(), self.group_messages_count)
+        response = self.query(query=group_messages_query, variables={'id': group_copy2_id}, headers={'Authorization': f'JWT {self.user2_token}'})
+        content = response.json()
+        self.assertNotIn(group_message_id, [edge['node']['id'] for edge in content['data']['group']['groupMessages']['edges']])
+        self.assertNotEqual(content['data']['group']['lastMessage']['id'], group_message_id)
+        group_copy3_id = Node.to_global_id('UserGroupMemberCopyType', self.group_member_copy3.id)
+        response = self.query(query=group_messages_query, variables={'id': group_copy3_id}, headers={'Authorization': f'JWT {self.user3_token}'})
+        content = response.json()
+        self.assertIn(group_message_id, [edge['node']['id'] for edge in content['data']['group']['groupMessages']['edges']])
+        
+        # A user that is not a member of the group is denied instead of failing
+        for mutation, variables in (
+            ('mutation DeleteGroupMessage($groupMessageId: ID!) { deleteGroupMessage(groupMessageId: $groupMessageId) { success } }', {'groupMessageId': group_message_id}),
+            ('mutation UpdateGroupMessage($groupMessageId: ID!) { updateGroupMessage(groupMessageId: $groupMessageId, content: "Hi") { groupMessage { id } } }', {'groupMessageId': group_message_id}),
+            ('mutation UnsendGroupMessage($groupMessageId: ID!) { unsendGroupMessage(groupMessageId: $groupMessageId) { success } }', {'groupMessageId': group_message_id}),
+        ):
+            response = self.query(mutation, variables=variables, headers={'Authorization': f'JWT {self.user4_token}'})
+            self.assertResponseHasErrors(response)
+            self.assertIn('not allowed', response.json()['errors'][0]['message'])
+        
+        # Unsending the message removes it for everyone
+        response = self.query(
+            '''
+            mutation UnsendGroupMessage($groupMessageId: ID!) {
+                unsendGroupMessage(groupMessageId: $groupMessageId) {
+                    success
+                }
+            }
+            ''',
+            variables={'groupMessageId': group_message_id},
+            headers={'Authorization': f'JWT {self.user1_token}'}
+        )
+        self.assertResponseNoErrors(response)
+        self.assertEqual(GroupMessage.objects.count(), self.group_messages_count - 1)
@@ -0,0 +1,56 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+from ..models import Chat, ChatMessage, CustomUser, Message
+
+class LoaderTestCase(GraphQLTestCase):
+    def setUp(self):
+        self.chats_query = '''
+            query {
+                chats(first: 20) {
+                    edges {
+                        node {
+                            otherUser {
+                                username
+                            }
+                            lastMessage {
+                                message {
+                                    content
+                                    sender {
+                                        username
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        '''
+
+    def create_chats(self, username, chats_count):
+        """Creates a user with the given number of chats, each one with a last message from the other user"""
+        user = CustomUser.objects.create(username=username, email=f'{username}@gg.com')
+        for i in range(chats_count):
+            other_user = CustomUser.objects.create(username=f'{username}_{i}', email=f'{username}_{i}@gg.com')
+            chat = Chat.objects.create(user=user, other_user=other_user)
+            message = Message.objects.create(sender=other_user, content=f'Hello {i}')
+            chat.last_message = ChatMessage.objects.create(chat=chat, message=message)
+            chat.save()
+        return user
+
+    def count_chats_queries(self, user):
+        token = get_token(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(self.chats_query, headers={'Authorization': f'JWT {token}'})
+        self.assertResponseNoErrors(response)
+        return len(context.captured_queries), response.json()['data']['chats']['edges']
+
+    def test_chats_query_count_does_not_depend_on_page_size(self):
+        small_queries, small_edges = self.count_chats_queries(self.create_chats('small', 2))
+        large_queries, large_edges = self.count_chats_queries(self.create_chats('large', 10))
+        self.assertEqual(len(large_edges), 10)
+        self.assertEqual(small_queries, large_queries)
+        for edge in large_edges:
+            node = edge['node']
+            self.assertEqual(node['lastMessage']['message']['sender']['username'], node['otherUser']['username'])
@@ -0,0 +1,43 @@
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase
+from graphql_jwt.shortcuts import get_token
+from ..models import CustomUser
+from ..GraphQL.subscriptions.middleware import JWTAuthMiddleware, token_cache
+from ..GraphQL.user_cache import user_cache
+
+class JWTAuthMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        token_cache.clear()
+        self.user = CustomUser.objects.create(username='socket', email='socket@gg.com')
+        self.token = get_token(self.user)
+        self.middleware = JWTAuthMiddleware(None)
+        # The user is in the process cache, so the lookups below do not need the database
+        user_cache.get_by_username('socket')
+
+    def test_verified_tokens_are_cached(self):
+        self.assertEqual(async_to_sync(self.middleware.get_user)(self.token).pk, self.user.pk)
+        self.assertEqual(token_cache.get(self.token), self.user.pk)
+        with mock.patch('BuddyChatAPI.GraphQL.subscriptions.middleware.jwt_decode') as jwt_decode:
+            self.assertEqual(async_to_sync(self.middleware.get_user)(self.token).pk, self.user.pk)
+        jwt_decode.assert_not_called()
+
+        # Saving the user forgets its tokens
+        self.user.save()
+        self.assertIsNone(token_cache.get(self.token))
+        self.assertIsNone(async_to_sync(self.middleware.get_user)('invalid'))
+
+    def test_cached_tokens_of_deactivated_users_are_rejected(self):
+        token_cache.set(self.token, self.user.pk, float('inf'))
+        # Deactivated by another process, which only forgot the tokens it cached itself
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.clear()
+        user_cache.clear()
+        self.assertIsNone(async_to_sync(self.middleware.get_user)(self.token))
+
+    def test_expired_tokens_are_dropped(self):
+        token_cache.set(self.token, self.user.pk, 0)
+        self.assertIsNone(token_cache.get(self.token))
@@ -0,0 +1,123 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from unittest import mock
+from graphene.relay import Node
+from graphql_jwt.shortcuts import get_token
+from django.core.cache import cache
+from ..models import Chat, CustomUser, Message, Notification
+
+class NotificationTestCase(GraphQLTestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = CustomUser.objects.create(username='sender', email='sender@gg.com')
+        self.receiver = CustomUser.objects.create(username='receiver', email='receiver@gg.com')
+        self.other = CustomUser.objects.create(username='other', email='other@gg.com')
+        self.receiver_chat = Chat.objects.create(user=self.receiver, other_user=self.sender)
+        self.other_chat = Chat.objects.create(user=self.receiver, other_user=self.other)
+        for sender, chat in ((self.sender, self.receiver_chat), (self.other, self.other_chat)):
+            message = Message.objects.create(sender=sender, content='Hello')
+            chat.chat_messages.create(message=message)
+            Notification.objects.create(receiver=self.receiver, message=message, chat=chat, count=2)
+
+    def mutate(self, user, query, variables):
+        response = self.query(query, variables=variables, headers={'Authorization': f'JWT {get_token(user)}'})
+        self.assertResponseNoErrors(response)
+        return response.json()['data']
+
+    def unread(self):
+        return Notification.objects.filter(receiver=self.receiver, is_read=False).count()
+
+    def test_set_notification_as_read(self):
+        notification = Notification.objects.first()
+        query = '''
+            mutation SetNotificationRead($notificationId: ID!) {
+                setNotificationRead(notificationId: $notificationId) {
+                    notification {
+                        isRead
+                    }
+                }
+            }
+        '''
+        variables = {'notificationId': Node.to_global_id('NotificationType', notification.id)}
+        response = self.query(query, variables=variables, headers={'Authorization': f'JWT {get_token(self.sender)}'})
+        self.assertResponseHasErrors(response)
+        self.mutate(self.receiver, query, variables)
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_read)
+        self.assertEqual(self.unread(), 1)
+
+    def test_set_notifications_as_read(self):
+        query = '''
+            mutation SetNotificationsRead($chatId: ID) {
+                setNotificationsRead(chatId: $chatId) {
+                    count
+                }
+            }
+        '''
+        with mock.patch('BuddyChatAPI.GraphQL.subscriptions.signals.publish') as publish:
+            data = self.mutate(self.receiver, query, {'chatId': Node.to_global_id('ChatType', self.receiver_chat.id)})
+            self.assertEqual(data['setNotificationsRead']['count'], 1)
+            self.assertEqual(self.unread(), 1)
+            data = self.mutate(self.receiver, query, {})
+            self.assertEqual(data['setNotificationsRead']['count'], 1)
+            # Nothing left to read, so nothing is broadcast
+            self.mutate(self.receiver, query, {})
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual([call.args[1]['notifications']['count'] for call in publish.call_args_list], [1, 1])
+
+    def test_notifications_are_coalesced_per_chat(self):
+        chat = Chat.objects.create(user=self.sender, other_user=self.receiver)
+        Notification.objects.filter(chat=self.receiver_chat).delete()
+        query = '''
+            mutation CreateChatMessage($chatId: ID!, $content: String!) {
+                createChatMessage(chatId: $chatId, content: $content) {
+                    chatMessage {
+                        id
+                    }
+                }
+            }
+        '''
+        with mock.patch('BuddyChatAPI.GraphQL.subscriptions.signals.publish') as publish:
+            for content in ('First', 'Second', 'Third'):
+                self.mutate(self.sender, query, {'chatId': Node.to_global_id('ChatType', chat.id), 'content': content})
+        notification = Notification.objects.get(chat=self.receiver_chat)
+        self.assertEqual((notification.count, notification.message.content, notification.is_read), (3, 'Third', False))
+        # Every change is published, the consumers of the receiver throttle them
+        counts = [call.args[1]['notification']['count'] for call in publish.call_args_list if call.args[1]['operation'] == 'NOTIFICATION_CREATED']
+        self.assertEqual(counts, [1, 2, 3])
+
+        Notification.objects.filter(pk=notification.pk).update(is_read=True)
+        self.mutate(self.sender, query, {'chatId': Node.to_global_id('ChatType', chat.id), 'content': 'Fourth'})
+        notification.refresh_from_db()
+        self.assertEqual((notification.count, notification.is_read), (1, False))
+
+    def test_unsent_message_is_uncounted(self):
+        chat = Chat.objects.create(user=self.sender, other_user=self.receiver)
+        Notification.objects.filter(chat=self.receiver_chat).delete()
+        create = '''
+            mutation CreateChatMessage($chatId: ID!, $content: String!) {
+                createChatMessage(chatId: $chatId, content: $content) {
+                    chatMessage {
+                        id
+                    }
+                }
+            }
+        '''
+        unsend = '''
+            mutation UnsendChatMessage($chatMessageId: ID!) {
+                unsendChatMessage(chatMessageId: $chatMessageId) {
+                    success
+                }
+            }
+        '''
+        chat_messages = []
+        for content in ('First', 'Second', 'Third'):
+            data = self.mutate(self.sender, create, {'chatId': Node.to_global_id('ChatType', chat.id), 'content': content})
+            chat_messages.append(data['createChatMessage']['chatMessage']['id'])
+        self.mutate(self.sender, unsend, {'chatMessageId': chat_messages[2]})
+        notification = Notification.objects.get(chat=self.receiver_chat)
+        self.assertEqual((notification.count, notification.message.content, notification.is_read), (2, 'Second', False))
+
+        # A notification that only announced the unsent message is removed
+        Notification.objects.filter(pk=notification.pk).update(count=1)
+        self.mutate(self.sender, unsend, {'chatMessageId': chat_messages[1]})
+        self.assertFalse(Notification.objects.filter(chat=self.receiver_chat).exists())
@@ -0,0 +1,54 @@
+from unittest import mock
+from django.db import connection, transaction
+from django.test import TestCase
+from ..GraphQL.subscriptions.outbox import commit_hooks, publish
+
+@mock.patch('BuddyChatAPI.GraphQL.subscriptions.outbox.send_events')
+class OutboxTestCase(TestCase):
+    def test_events_are_sent_together_on_commit(self, send_events):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                publish('user_test', {'type': 'broadcast', 'operation': 'FIRST'})
+                publish('user_test', {'type': 'broadcast', 'operation': 'SECOND'})
+                send_events.assert_not_called()
+        send_events.assert_called_once()
+        events = send_events.call_args[0][0]
+        self.assertEqual([message['operation'] for _, message in events], ['FIRST', 'SECOND'])
+
+    def test_events_of_rolled_back_savepoint_are_dropped(self, send_events):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                publish('user_test', {'type': 'broadcast', 'operation': 'KEPT'})
+                try:
+                    with transaction.atomic():
+                        publish('user_test', {'type': 'broadcast', 'operation': 'DROPPED'})
+                        raise ValueError
+                except ValueError:
+                    pass
+                publish('user_test', {'type': 'broadcast', 'operation': 'AFTER'})
+        operations = [message['operation'] for call in send_events.call_args_list for _, message in call[0][0]]
+        self.assertEqual(operations, ['KEPT', 'AFTER'])
+
+    def test_events_of_committed_savepoints_keep_their_order(self, send_events):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                publish('user_test', {'type': 'broadcast', 'operation': 'A'})
+                with transaction.atomic():
+                    publish('user_test', {'type': 'broadcast', 'operation': 'B'})
+                publish('user_test', {'type': 'broadcast', 'operation': 'C'})
+                try:
+                    with transaction.atomic():
+                        publish('user_test', {'type': 'broadcast', 'operation': 'DROPPED'})
+                        raise ValueError
+                except ValueError:
+                    pass
+        send_events.assert_called_once()
+        self.assertEqual([message['operation'] for _, message in send_events.call_args[0][0]], ['A', 'B', 'C'])
+
+    def test_commit_hooks_layout(self, send_events):
+        # The outbox relies on the private commit callback list of Django, checked on Django 5.1
+        callback = mock.Mock()
+        with transaction.atomic():
+            with transaction.atomic():
+                transaction.on_commit(callback, robust=True)
+                self.assertEqual(commit_hooks(connection)[-1], (set(connection.savepoint_ids), callback, True))
@@ -0,0 +1,61 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from graphene.relay import Node
+from graphql_jwt.shortcuts import get_token
+from ..models import Chat, ChatMessage, CustomUser, Message
+
+class MessageTimelineTestCase(GraphQLTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='test', email='test@gg.com')
+        other_user = CustomUser.objects.create(username='test1', email='test1@gg.com')
+        self.chat = Chat.objects.create(user=self.user, other_user=other_user)
+        messages = [Message.objects.create(sender=other_user, content=f'Hello {i}') for i in range(5)]
+        for message in messages:
+            ChatMessage.objects.create(chat=self.chat, message=message)
+        # Two messages sent at the same time are ordered by id
+        ChatMessage.objects.filter(message=messages[3]).update(date=messages[2].date)
+        self.timeline_query = '''
+            query Chat($id: ID!, $first: Int = 2, $after: String) {
+                chat(id: $id) {
+                    messageTimeline(first: $first, after: $after) {
+                        edges {
+                            cursor
+                            node {
+                                message {
+                                    content
+                                }
+                            }
+                        }
+                        pageInfo {
+                            hasNextPage
+                            endCursor
+                        }
+                    }
+                }
+            }
+        '''
+
+    def test_message_timeline_pages(self):
+        contents = []
+        after = None
+        for _ in range(3):
+            response = self.query(
+                self.timeline_query,
+                variables={'id': Node.to_global_id('ChatType', self.chat.id), 'after': after},
+                headers={'Authorization': f'JWT {get_token(self.user)}'}
+            )
+            self.assertResponseNoErrors(response)
+            timeline = response.json()['data']['chat']['messageTimeline']
+            contents += [edge['node']['message']['content'] for edge in timeline['edges']]
+            after = timeline['pageInfo']['endCursor']
+        self.assertEqual(contents, ['Hello 4', 'Hello 3', 'Hello 2', 'Hello 1', 'Hello 0'])
+        self.assertFalse(timeline['pageInfo']['hasNextPage'])
+
+    def test_non_positive_first_is_rejected(self):
+        for first in (0, -1):
+            response = self.query(
+                self.timeline_query,
+                variables={'id': Node.to_global_id('ChatType', self.chat.id), 'first': first},
+                headers={'Authorization': f'JWT {get_token(self.user)}'}
+            )
+            self.assertResponseHasErrors(response)
+            self.assertEqual(response.json()['errors'][0]['message'], 'first must be a positive number')
@@ -0,0 +1,62 @@
+import hashlib
+from django.test import TestCase, override_settings
+from ..GraphQL import persisted_queries
+from ..GraphQL.persisted_queries import register_persisted_query
+from graphql_jwt.shortcuts import get_token
+from ..models import CustomUser, PersistedQuery
+
+class PersistedQueryTestCase(TestCase):
+    def setUp(self):
+        persisted_queries._queries.clear()
+        self.query = '{ __typename }'
+        self.sha256_hash = hashlib.sha256(self.query.encode()).hexdigest()
+
+    def post(self, body, **headers):
+        return self.client.post('/graphql', body, content_type='application/json', headers=headers).json()
+
+    def persisted_query_extensions(self, sha256_hash):
+        return {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}}
+
+    def test_unknown_hash_is_registered_on_miss(self):
+        response = self.post({'extensions': self.persisted_query_extensions(self.sha256_hash)})
+        self.assertEqual(response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        response = self.post({'query': self.query, 'extensions': self.persisted_query_extensions(self.sha256_hash)})
+        self.assertEqual(response['data'], {'__typename': 'Query'})
+        # The queries of anonymous clients are only kept in the process
+        self.assertFalse(PersistedQuery.objects.filter(sha256_hash=self.sha256_hash).exists())
+
+        response = self.post({'extensions': self.persisted_query_extensions(self.sha256_hash)})
+        self.assertEqual(response['data'], {'__typename': 'Query'})
+
+    def test_only_valid_queries_of_authenticated_users_are_stored(self):
+        user = CustomUser.objects.create(username='persisted', email='persisted@gg.com')
+        authorization = f'JWT {get_token(user)}'
+        invalid_query = '{ unknownField }'
+        invalid_hash = hashlib.sha256(invalid_query.encode()).hexdigest()
+        response = self.post({'query': invalid_query, 'extensions': self.persisted_query_extensions(invalid_hash)}, Authorization=authorization)
+        self.assertIn('errors', response)
+        response = self.post({'extensions': self.persisted_query_extensions(invalid_hash)})
+        self.assertEqual(response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        query = '{ chats(first: 1) { edges { node { id } } } }'
+        sha256_hash = hashlib.sha256(query.encode()).hexdigest()
+        response = self.post({'query': query, 'extensions': self.persisted_query_extensions(sha256_hash)}, Authorization=authorization)
+        self.assertNotIn('errors', response)
+        self.assertTrue(PersistedQuery.objects.filter(sha256_hash=sha256_hash).exists())
+        self.assertFalse(PersistedQuery.objects.filter(sha256_hash=invalid_hash).exists())
+
+    def test_hash_must_match_the_query(self):
+        response = self.post({'query': self.query, 'extensions': self.persisted_query_extensions('0' * 64)})
+        self.assertEqual(response['errors'][0]['extensions']['code'], 'INVALID_PERSISTED_QUERY_HASH')
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES_ONLY=True)
+    def test_only_registered_queries_are_allowed(self):
+        response = self.post({'query': self.query})
+        self.assertEqual(response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_ALLOWED')
+        response = self.post({'query': self.query, 'extensions': self.persisted_query_extensions(self.sha256_hash)})
+        self.assertEqual(response['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_ALLOWED')
+
+        register_persisted_query(self.query)
+        response = self.post({'extensions': self.persisted_query_extensions(self.sha256_hash)})
+        self.assertEqual(response['data'], {'__typename': 'Query'})
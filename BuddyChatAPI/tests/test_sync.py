@@ -0,0 +1,100 @@
+from datetime import timedelta
+from graphene_django.utils.testing import GraphQLTestCase
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from graphene.relay import Node
+from graphql_jwt.shortcuts import get_token
+from ..GraphQL.sync import encode_sync_cursor
+from ..models import Chat, ChatMessage, CustomUser, Message, Notification
+
+CHANGES_SINCE = '''
+    query ChangesSince($cursor: String) {
+        changesSince(cursor: $cursor) {
+            cursor
+            resyncRequired
+            chats {
+                id
+            }
+            chatMessages {
+                id
+            }
+            deletions {
+                id
+                typeName
+            }
+        }
+    }
+'''
+
+@override_settings(SYNC_CURSOR_OVERLAP=0)
+class ChangesSinceTestCase(GraphQLTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='user', email='user@gg.com')
+        self.other = CustomUser.objects.create_user(username='other', email='other@gg.com', password='123456789Test')
+        self.chat = Chat.objects.create(user=self.user, other_user=self.other)
+        Chat.objects.create(user=self.other, other_user=self.user)
+        self.headers = {'Authorization': f'JWT {get_token(self.user)}'}
+
+    def changes_since(self, cursor=None):
+        response = self.query(CHANGES_SINCE, variables={'cursor': cursor}, headers=self.headers)
+        self.assertResponseNoErrors(response)
+        return response.json()['data']['changesSince']
+
+    def test_changes_since_lists_the_changes_and_deletions(self):
+        cursor = self.changes_since()['cursor']
+        response = self.query('''
+            mutation CreateChatMessage($chatId: ID!, $content: String!) {
+                createChatMessage(chatId: $chatId, content: $content) {
+                    chatMessage {
+                        id
+                    }
+                }
+            }
+        ''', variables={'chatId': Node.to_global_id('ChatType', self.chat.id), 'content': 'Hello'}, headers=self.headers)
+        self.assertResponseNoErrors(response)
+        chat_message_id = response.json()['data']['createChatMessage']['chatMessage']['id']
+
+        changes = self.changes_since(cursor)
+        self.assertFalse(changes['resyncRequired'])
+        self.assertEqual(changes['chats'], [{'id': Node.to_global_id('ChatType', self.chat.id)}])
+        self.assertEqual(changes['chatMessages'], [{'id': chat_message_id}])
+        self.assertEqual(changes['deletions'], [])
+
+        response = self.query('''
+            mutation DeleteChatMessage($chatMessageId: ID!) {
+                deleteChatMessage(chatMessageId: $chatMessageId) {
+                    success
+                }
+            }
+        ''', variables={'chatMessageId': chat_message_id}, headers=self.headers)
+        self.assertResponseNoErrors(response)
+        changes = self.changes_since(changes['cursor'])
+        self.assertEqual(changes['chatMessages'], [])
+        self.assertEqual(changes['deletions'], [{'id': chat_message_id, 'typeName': 'ChatMessageType'}])
+
+        # The tombstones older than the cursor were pruned, so the client has to resync
+        changes = self.changes_since(encode_sync_cursor(timezone.now() - timedelta(days=31)))
+        self.assertTrue(changes['resyncRequired'])
+        self.assertIsNone(changes['chats'])
+
+    def test_changes_since_lists_the_rows_removed_with_a_deleted_user(self):
+        message = Message.objects.create(sender=self.other, content='Hello')
+        chat_message = ChatMessage.objects.create(chat=self.chat, message=message)
+        notification = Notification.objects.create(receiver=self.user, message=message, chat=self.chat)
+        cursor = self.changes_since()['cursor']
+        # The copy changes with its message
+        Message.objects.filter(pk=message.pk).update(content='Edited')
+        self.assertEqual(self.changes_since(cursor)['chatMessages'], [{'id': Node.to_global_id('ChatMessageType', chat_message.id)}])
+
+        response = self.query('''
+            mutation DeleteUser($password: String!) {
+                deleteUser(password: $password) {
+                    userId
+                }
+            }
+        ''', variables={'password': '123456789Test'}, headers={'Authorization': f'JWT {get_token(self.other)}'})
+        self.assertResponseNoErrors(response)
+        deletions = {(deletion['typeName'], deletion['id']) for deletion in self.changes_since(cursor)['deletions']}
+        self.assertEqual(deletions, {('ChatType', Node.to_global_id('ChatType', self.chat.id)), ('NotificationType', Node.to_global_id('NotificationType', notification.id))})
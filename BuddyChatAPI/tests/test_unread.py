@@ -0,0 +1,170 @@
+from graphene_django.utils.testing import GraphQLTestCase
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from graphene.relay import Node
+from graphql_jwt.shortcuts import get_token
+from ..models import Chat, ChatMessage, CustomUser, GroupMember, UserGroup, UserGroupMemberCopy
+
+class UnreadCountTestCase(GraphQLTestCase):
+    def setUp(self):
+        self.sender = CustomUser.objects.create(username='sender', email='sender@gg.com')
+        self.receiver = CustomUser.objects.create(username='receiver', email='receiver@gg.com')
+        self.chat = Chat.objects.create(user=self.sender, other_user=self.receiver)
+        self.receiver_chat = Chat.objects.create(user=self.receiver, other_user=self.sender)
+
+    def mutate(self, user, query, variables):
+        response = self.query(query, variables=variables, headers={'Authorization': f'JWT {get_token(user)}'})
+        self.assertResponseNoErrors(response)
+        return response.json()['data']
+
+    def send_chat_message(self, content):
+        self.mutate(self.sender, '''
+            mutation CreateChatMessage($chatId: ID!, $content: String!) {
+                createChatMessage(chatId: $chatId, content: $content) {
+                    chatMessage {
+                        id
+                    }
+                }
+            }
+        ''', {'chatId': Node.to_global_id('ChatType', self.chat.id), 'content': content})
+        return ChatMessage.objects.get(chat=self.receiver_chat, message__content=content)
+
+    def unread_counts(self):
+        self.chat.refresh_from_db()
+        self.receiver_chat.refresh_from_db()
+        return self.chat.unread_count, self.receiver_chat.unread_count
+
+    def test_chat_unread_count(self):
+        first = self.send_chat_message('First')
+        second = self.send_chat_message('Second')
+        self.send_chat_message('Third')
+        self.assertEqual(self.unread_counts(), (0, 3))
+
+        set_as_read = '''
+            mutation SetChatMessageAsRead($chatMessageId: ID!) {
+                setChatMessageAsRead(chatMessageId: $chatMessageId) {
+                    chatMessage {
+                        id
+                    }
+                }
+            }
+        '''
+        # Reading a message twice only counts once
+        for _ in range(2):
+            self.mutate(self.receiver, set_as_read, {'chatMessageId': Node.to_global_id('ChatMessageType', first.id)})
+        self.assertEqual(self.unread_counts(), (0, 2))
+
+        # Neither the sender nor a stranger can read the receiver's copy
+        stranger = CustomUser.objects.create(username='stranger', email='stranger@gg.com')
+        for user in (self.sender, stranger):
+            response = self.query(set_as_read, variables={'chatMessageId': Node.to_global_id('ChatMessageType', second.id)}, headers={'Authorization': f'JWT {get_token(user)}'})
+            self.assertEqual(response.json()['errors'][0]['message'], 'You are not allowed to read this message')
+        self.assertEqual(self.unread_counts(), (0, 2))
+
+        self.mutate(self.receiver, '''
+            mutation DeleteChatMessage($chatMessageId: ID!) {
+                deleteChatMessage(chatMessageId: $chatMessageId) {
+                    success
+                }
+            }
+        ''', {'chatMessageId': Node.to_global_id('ChatMessageType', second.id)})
+        self.assertEqual(self.unread_counts(), (0, 1))
+
+        Chat.objects.update(unread_count=10)
+        call_command('reconcile_unread_counts', stdout=StringIO())
+        self.assertEqual(self.unread_counts(), (0, 1))
+
+    def test_mark_chat_as_read(self):
+        first = self.send_chat_message('First')
+        self.send_chat_message('Second')
+        third = self.send_chat_message('Third')
+        mark_as_read = '''
+            mutation MarkChatAsRead($chatId: ID!, $chatMessageId: ID) {
+                markChatAsRead(chatId: $chatId, chatMessageId: $chatMessageId) {
+                    chat {
+                        unreadCount
+                    }
+                }
+            }
+        '''
+        receiver_chat_id = Node.to_global_id('ChatType', self.receiver_chat.id)
+        with mock.patch('BuddyChatAPI.GraphQL.subscriptions.signals.publish') as publish:
+            data = self.mutate(self.receiver, mark_as_read, {'chatId': receiver_chat_id, 'chatMessageId': Node.to_global_id('ChatMessageType', first.id)})
+            self.assertEqual(data['markChatAsRead']['chat']['unreadCount'], 2)
+            data = self.mutate(self.receiver, mark_as_read, {'chatId': receiver_chat_id})
+            self.assertEqual(data['markChatAsRead']['chat']['unreadCount'], 0)
+            # The watermark does not move back
+            self.mutate(self.receiver, mark_as_read, {'chatId': receiver_chat_id, 'chatMessageId': Node.to_global_id('ChatMessageType', first.id)})
+        self.assertEqual([call.args[1]['operation'] for call in publish.call_args_list], ['CHAT_READ', 'CHAT_READ'])
+        self.assertEqual(publish.call_args.args[0], 'user_sender')
+
+        self.chat.refresh_from_db()
+        self.assertEqual((self.chat.other_read_until, self.chat.other_read_until_message_id), (third.date, third.message_id))
+        # Deleting a message under the watermark does not change the count
+        self.mutate(self.receiver, '''
+            mutation DeleteChatMessage($chatMessageId: ID!) {
+                deleteChatMessage(chatMessageId: $chatMessageId) {
+                    success
+                }
+            }
+        ''', {'chatMessageId': Node.to_global_id('ChatMessageType', first.id)})
+        self.assertEqual(self.unread_counts(), (0, 0))
+
+        response = self.query('''
+            query Chat($id: ID!) {
+                chat(id: $id) {
+                    messageTimeline {
+                        edges {
+                            node {
+                                isRead
+                            }
+                        }
+                    }
+                }
+            }
+        ''', variables={'id': Node.to_global_id('ChatType', self.chat.id)}, headers={'Authorization': f'JWT {get_token(self.sender)}'})
+        self.assertResponseNoErrors(response)
+        self.assertEqual([edge['node']['isRead'] for edge in response.json()['data']['chat']['messageTimeline']['edges']], [True, True, True])
+
+        Chat.objects.update(unread_count=10)
+        call_command('reconcile_unread_counts', stdout=StringIO())
+        self.assertEqual(self.unread_counts(), (0, 0))
+
+    def test_group_unread_count(self):
+        user_group = UserGroup.objects.create(title='group', created_by=self.sender, members_count=2)
+        sender_copy = UserGroupMemberCopy.objects.create(member=GroupMember.objects.create(user_group=user_group, member=self.sender))
+        receiver_copy = UserGroupMemberCopy.objects.create(member=GroupMember.objects.create(user_group=user_group, member=self.receiver))
+        self.mutate(self.sender, '''
+            mutation CreateGroupMessage($groupCopyId: ID!, $content: String!) {
+                createGroupMessage(groupCopyId: $groupCopyId, content: $content) {
+                    groupMessage {
+                        id
+                    }
+                }
+            }
+        ''', {'groupCopyId': Node.to_global_id('UserGroupMemberCopyType', sender_copy.id), 'content': 'Hello group'})
+        sender_copy.refresh_from_db()
+        receiver_copy.refresh_from_db()
+        self.assertEqual((sender_copy.unread_count, receiver_copy.unread_count), (0, 1))
+
+        UserGroupMemberCopy.objects.update(unread_count=5)
+        updated_at = list(UserGroupMemberCopy.objects.order_by('id').values_list('updated_at', flat=True))
+        call_command('reconcile_unread_counts', stdout=StringIO())
+        self.assertEqual(list(UserGroupMemberCopy.objects.order_by('id').values_list('unread_count', flat=True)), [0, 1])
+        # The recount is not a change changesSince reports
+        self.assertEqual(list(UserGroupMemberCopy.objects.order_by('id').values_list('updated_at', flat=True)), updated_at)
+
+        with mock.patch('BuddyChatAPI.GraphQL.subscriptions.signals.publish') as publish:
+            data = self.mutate(self.receiver, '''
+                mutation MarkGroupAsRead($groupCopyId: ID!) {
+                    markGroupAsRead(groupCopyId: $groupCopyId) {
+                        groupCopy {
+                            unreadCount
+                        }
+                    }
+                }
+            ''', {'groupCopyId': Node.to_global_id('UserGroupMemberCopyType', receiver_copy.id)})
+        self.assertEqual(data['markGroupAsRead']['groupCopy']['unreadCount'], 0)
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.args[1]['operation'], 'GROUP_READ')
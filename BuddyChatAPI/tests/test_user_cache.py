@@ -0,0 +1,56 @@
+from django.test import TestCase
+from django.core.cache import cache
+from ..models import CustomUser
+from ..GraphQL.user_cache import USER_FIELDS, user_cache, get_user_by_natural_key
+
+class UserCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = CustomUser.objects.create_user(username='cached', email='cached@gg.com', password='123456789Test', first_name='first')
+
+    def test_users_are_cached(self):
+        self.assertEqual(user_cache.get(self.user.pk).username, 'cached')
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.get(self.user.pk).first_name, 'first')
+            self.assertEqual(get_user_by_natural_key('cached').pk, self.user.pk)
+        # Once the process entries expire the shared cache answers
+        user_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.get(self.user.pk).username, 'cached')
+        self.assertIsNone(user_cache.get_by_username('missing'))
+
+    def test_saving_a_user_invalidates_it(self):
+        user = user_cache.get(self.user.pk)
+        user.first_name = 'changed'
+        user.save()
+        self.assertEqual(user_cache.get(self.user.pk).first_name, 'changed')
+        # The password is not cached, it is loaded when needed
+        self.assertTrue(user_cache.get(self.user.pk).check_password('123456789Test'))
+
+        self.user.delete()
+        self.assertIsNone(user_cache.get(user.pk))
+
+    def test_renamed_user_is_invalidated_under_both_usernames(self):
+        self.assertEqual(get_user_by_natural_key('cached').pk, self.user.pk)
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertIsNone(get_user_by_natural_key('cached'))
+        self.assertEqual(get_user_by_natural_key('renamed').pk, self.user.pk)
+
+        # A loaded user knows the username it is cached under, so saving it does not read the row again
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.username = 'loaded'
+        with self.assertNumQueries(1):
+            user.save()
+        self.assertIsNone(get_user_by_natural_key('renamed'))
+        self.assertEqual(get_user_by_natural_key('loaded').pk, self.user.pk)
+
+    def test_row_read_before_an_invalidation_is_not_cached(self):
+        stale = CustomUser.objects.filter(pk=self.user.pk).values_list(*USER_FIELDS).first()
+        self.user.first_name = 'changed'
+        self.user.save(update_fields=['first_name'])
+        # A concurrent request that read the old row stores it after the invalidation
+        user_cache.store(stale)
+        user_cache.clear()
+        self.assertEqual(user_cache.get(self.user.pk).first_name, 'changed')
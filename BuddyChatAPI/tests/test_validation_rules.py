@@ -0,0 +1,25 @@
+from django.test import SimpleTestCase
+from graphql import parse, validate
+from ..GraphQL.schema import schema
+from ..GraphQL.validation_rules import QueryDepthRule
+
+def chats_query(levels):
+    """A query that nests its fields through one fragment per level"""
+    fragments = ['fragment Level0 on ChatType { user { id } }']
+    for level in range(1, levels + 1):
+        fragments.append(f'fragment Level{level} on ChatType {{ user {{ chats {{ edges {{ node {{ ...Level{level - 1} }} }} }} }} }}')
+    return 'query { chats { edges { node { ...Level%d } } } }\n' % levels + '\n'.join(fragments)
+
+class QueryDepthRuleTestCase(SimpleTestCase):
+    def validate(self, query):
+        return validate(schema.graphql_schema, parse(query), [QueryDepthRule])
+
+    def test_shallow_query_is_valid(self):
+        self.assertEqual(self.validate(chats_query(2)), [])
+
+    def test_deep_query_through_fragments_is_rejected(self):
+        errors = self.validate(chats_query(5))
+        self.assertEqual(len(errors), 1)
+        self.assertIn('Query is too deep', errors[0].message)
+        # The depth of the same query text is reused
+        self.assertEqual(len(self.validate(chats_query(5))), 1)
@@ -0,0 +1,29 @@
+from django.test import TestCase
+from ..GraphQL.documents import document_cache
+
+class AsyncGraphQLViewTestCase(TestCase):
+    async def test_query_over_asgi(self):
+        response = await self.async_client.post(
+            '/graphql',
+            {'query': '{ __typename }'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], {'__typename': 'Query'})
+
+    def test_query_over_wsgi(self):
+        response = self.client.post(
+            '/graphql',
+            {'query': '{ __typename }'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], {'__typename': 'Query'})
+
+    def test_parsed_documents_are_cached(self):
+        document_cache.clear()
+        for _ in range(3):
+            response = self.client.post('/graphql', {'query': '{ __typename }'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(document_cache.info()['misses'], 1)
+        self.assertEqual(document_cache.info()['hits'], 2)
@@ -1,3 +1,99 @@
-from django.shortcuts import render
+import json
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, specified_rules, validate_schema
+from .GraphQL.cost import CostExecutionContext
+from .GraphQL.documents import document_cache
+from .GraphQL.persisted_queries import remember_persisted_query, resolve_persisted_query
+from .GraphQL.validation_rules import QueryDepthRule
 
-# Create your views here.
+_executor = None
+
+def get_executor():
+    """Returns the pool that runs the GraphQL requests served over ASGI, its size is GRAPHQL_EXECUTOR_THREADS"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'GRAPHQL_EXECUTOR_THREADS', 8), thread_name_prefix='graphql')
+    return _executor
+
+class AsyncGraphQLView(GraphQLView):
+    """GraphQL view for ASGI servers. The schema is executed in a bounded thread pool,
+    so concurrent requests do not wait on each other in the single sync thread of the ASGI handler"""
+    view_is_async = True
+    validation_rules = (*specified_rules, QueryDepthRule)
+    execution_context_class = CostExecutionContext
+
+    async def dispatch(self, request, *args, **kwargs):
+        if isinstance(request, ASGIRequest):
+            handler = database_sync_to_async(super().dispatch, thread_sensitive=False, executor=get_executor())
+        else:
+            # Under WSGI (and the test client) the request already has its own thread and database connection
+            handler = sync_to_async(super().dispatch)
+        return await handler(request, *args, **kwargs)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """Executes a query like GraphQLView, with the parsed and validated document taken from the document cache"""
+        extensions = self.get_extensions(request, data)
+        try:
+            query = resolve_persisted_query(query, extensions)
+        except GraphQLError as error:
+            return ExecutionResult(data=None, errors=[error])
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+
+        schema = self.schema.graphql_schema
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, validation_errors = document_cache.get(schema, query, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS)
+        if document is None or validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if request.method.lower() == 'get' and operation_ast is not None and operation_ast.operation != OperationType.QUERY:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseNotAllowed(['POST'], f'Can only perform a {operation_ast.operation.value} operation from a POST request.'))
+
+        try:
+            # Mutations run in their own transaction through the atomic mutation middleware
+            result = execute(
+                schema,
+                document,
+                root_value=self.get_root_value(request),
+                context_value=self.get_context(request),
+                variable_values=variables,
+                operation_name=operation_name,
+                middleware=self.get_middleware(request),
+                execution_context_class=self.execution_context_class,
+            )
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        # The JWT middleware authenticated the request while it was executed
+        remember_persisted_query(query, extensions, getattr(request, 'user', None))
+        return result
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+        return extensions
+
+    def json_encode(self, request, d, pretty=False):
+        cost = getattr(request, 'graphql_cost', None)
+        if cost is not None:
+            d = {**d, 'extensions': {'cost': cost}}
+        return super().json_encode(request, d, pretty)